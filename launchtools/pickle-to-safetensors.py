@@ -1,7 +1,8 @@
 # Internally called by StableSwarmUI
-# python -s launchtools/pickle-to-safetensors.py <path> <fp16(true/false)>
+# python -s launchtools/pickle-to-safetensors.py <path> <fp16(true/false)> [workers]
 
-import os, sys, glob, traceback
+import os, sys, glob, traceback, json, time, struct, hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 sys.path.append(os.path.dirname(__file__))
 
@@ -14,72 +15,231 @@ try:
 except ImportError:
     os.system('python -m pip install safetensors')
 import torch
-from safetensors.torch import save_file
 
-fp16 = sys.argv[2].lower() == 'true'
+import pickle_module
 
-path = sys.argv[1]
-def get_all(ext):
-    return glob.glob(f"{path}/**/*.{ext}", recursive=True)
-files = get_all('ckpt') + get_all('pt') + get_all('bin') + get_all('pth')
+# Rough RAM budget for conversions running at once. A legacy-format file needs about twice its size in memory while converting, memory-mapped ones much less, so this errs on the safe side
+MEMORY_BUDGET = int(os.environ.get("SWARM_CONVERT_MEMORY_MB", "8192")) * 1024 * 1024
+MANIFEST_NAME = "convert_manifest.json"
+# Hashes of converted outputs, so they can be looked up rather than re-hashing multi-GB files
+HASH_INDEX_NAME = "hash_index.json"
+# Written into the header up front and filled in once the tensor data has been hashed, matching how Swarm computes modelspec.hash_sha256
+HASH_PLACEHOLDER = "0x" + "0" * 64
 
-import pickle_module
+SAFETENSORS_DTYPES = {
+    torch.float64: "F64", torch.float32: "F32", torch.float16: "F16", torch.bfloat16: "BF16",
+    torch.int64: "I64", torch.int32: "I32", torch.int16: "I16", torch.int8: "I8", torch.uint8: "U8", torch.bool: "BOOL"
+}
 
-for file in files:
+def load_lazy(file):
+    """Loads a checkpoint memory-mapped where the file format allows, so tensor data is only read from disk when actually used."""
     try:
-        if '/backups/' in file.replace('\\', '/'):
-            continue
-        print(f"Will convert {file}...")
-        last_dot = file.rindex('.')
-        fname_clean = file[:last_dot]
+        return torch.load(file, map_location='cpu', pickle_module=pickle_module, mmap=True)
+    except (RuntimeError, TypeError):
+        # Legacy (non-zipfile) torch format or an older torch without mmap support
         with open(file, 'rb') as f:
-            tens = torch.load(f, map_location='cpu', pickle_module=pickle_module)
-            metadata = {}
-            # Stable-Diffusion checkpoint model data
-            if "state_dict" in tens:
-                tens = tens["state_dict"]
-            # TI Embedding data
-            if "string_to_param" in tens:
-                vals = next(iter(tens["string_to_param"].values()))
-                if isinstance(vals, torch.nn.ParameterDict):
-                    vals = {k: v.data for k, v in vals.items()}
-                if isinstance(vals, torch.nn.Parameter):
-                    vals = vals.data
-                tens["emb_params"] = vals
-                del tens["string_to_param"]
-            if "name" in tens:
-                name = str(tens["name"])
-                if name:
-                    metadata["modelspec.title"] = name
-                    del tens["name"]
-            if "sd_checkpoint" in tens:
-                ckpt_name = str(tens["sd_checkpoint"])
-                if ckpt_name:
-                    metadata["modelspec.description"] = f"Embedding trained against '{ckpt_name}'"
-                    del tens["sd_checkpoint"]
-            if "sd_checkpoint_name" in tens:
-                ckpt_name = str(tens["sd_checkpoint_name"])
-                if ckpt_name:
-                    metadata["modelspec.description"] = f"Embedding trained against '{ckpt_name}'"
-                    del tens["sd_checkpoint_name"]
-            # General cleanup
-            for k, v in dict(tens).items():
-                if k.startswith("loss."): # VAE stray data
-                    del tens[k]
-                elif k.startswith("model_ema."): # Stable-Diffusion checkpoint model stray data
-                    del tens[k]
-                elif type(v) != torch.Tensor:
-                    raw_data = str(v)
-                    if (len(raw_data) > 100):
-                        raw_data = raw_data[:100] + "..."
-                    print(f"discard {k} = {raw_data}")
-                    del tens[k]
-                elif fp16:
-                    tens[k] = tens[k].half()
-            save_file(tens, fname_clean + '.safetensors', metadata=metadata)
-        rel = os.path.relpath(file, path)
-        os.makedirs(os.path.dirname(f"{path}/backups/{rel}"), exist_ok=True)
-        os.rename(file, f"{path}/backups/{rel}")
+            return torch.load(f, map_location='cpu', pickle_module=pickle_module)
+
+def tensor_checksum(tensor):
+    return hashlib.sha1(tensor.contiguous().reshape(-1).view(torch.uint8).numpy()).hexdigest()
+
+def save_file_streaming(tens, filename, metadata, fp16):
+    """Writes a safetensors file one tensor at a time, casting each as it's written, so peak memory is one tensor rather than the whole model.
+    Output goes to a temp file, which is verified by reading it back before being renamed into place.
+    Returns the modelspec hash (sha256 of the tensor data)."""
+    out_dtypes = {k: torch.float16 if fp16 else v.dtype for k, v in tens.items()}
+    header = {"__metadata__": metadata | {"modelspec.hash_sha256": HASH_PLACEHOLDER}}
+    offset = 0
+    for k, v in tens.items():
+        size = v.numel() * torch.empty((), dtype=out_dtypes[k]).element_size()
+        header[k] = {"dtype": SAFETENSORS_DTYPES[out_dtypes[k]], "shape": list(v.shape), "data_offsets": [offset, offset + size]}
+        offset += size
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * ((8 - len(header_bytes) % 8) % 8)
+    checksums = {}
+    data_hash = hashlib.sha256()
+    with open(filename + ".tmp", 'wb') as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for k, v in tens.items():
+            data = v.to(out_dtypes[k]).contiguous().reshape(-1).view(torch.uint8).numpy()
+            checksums[k] = hashlib.sha1(data).hexdigest()
+            data_hash.update(data)
+            f.write(data)
+        spec_hash = "0x" + data_hash.hexdigest()
+        f.seek(8 + header_bytes.index(HASH_PLACEHOLDER.encode("utf-8")))
+        f.write(spec_hash.encode("utf-8"))
+    try:
+        verify_converted(filename + ".tmp", tens, out_dtypes, checksums)
+    except:
+        os.remove(filename + ".tmp")
+        raise
+    os.replace(filename + ".tmp", filename)
+    return spec_hash
+
+def verify_converted(filename, tens, out_dtypes, checksums):
+    """Reads a written safetensors file back and checks its tensor names, shapes, dtypes and data checksums against the source."""
+    from safetensors import safe_open
+    with safe_open(filename, framework="pt") as f:
+        keys = set(f.keys())
+        if keys != set(tens.keys()):
+            raise ValueError(f"Converted file has mismatched tensors: missing {set(tens.keys()) - keys}, unexpected {keys - set(tens.keys())}")
+        for k in keys:
+            out = f.get_tensor(k)
+            if list(out.shape) != list(tens[k].shape) or out.dtype != out_dtypes[k]:
+                raise ValueError(f"Converted tensor {k} is {out.dtype} {list(out.shape)}, expected {out_dtypes[k]} {list(tens[k].shape)}")
+            if tensor_checksum(out) != checksums[k]:
+                raise ValueError(f"Converted tensor {k} does not match its source data")
+
+def file_sha256(file):
+    hasher = hashlib.sha256()
+    with open(file, 'rb') as f:
+        while chunk := f.read(16 * 1024 * 1024):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def write_converted(file, fname_clean, fp16):
+    tens = load_lazy(file)
+    metadata = {}
+    # Stable-Diffusion checkpoint model data
+    if "state_dict" in tens:
+        tens = tens["state_dict"]
+    # TI Embedding data
+    if "string_to_param" in tens:
+        vals = next(iter(tens["string_to_param"].values()))
+        if isinstance(vals, torch.nn.ParameterDict):
+            vals = {k: v.data for k, v in vals.items()}
+        if isinstance(vals, torch.nn.Parameter):
+            vals = vals.data
+        tens["emb_params"] = vals
+        del tens["string_to_param"]
+    if "name" in tens:
+        name = str(tens["name"])
+        if name:
+            metadata["modelspec.title"] = name
+            del tens["name"]
+    if "sd_checkpoint" in tens:
+        ckpt_name = str(tens["sd_checkpoint"])
+        if ckpt_name:
+            metadata["modelspec.description"] = f"Embedding trained against '{ckpt_name}'"
+            del tens["sd_checkpoint"]
+    if "sd_checkpoint_name" in tens:
+        ckpt_name = str(tens["sd_checkpoint_name"])
+        if ckpt_name:
+            metadata["modelspec.description"] = f"Embedding trained against '{ckpt_name}'"
+            del tens["sd_checkpoint_name"]
+    # General cleanup, done before any tensor data is touched so dropped keys are never read from disk
+    for k, v in dict(tens).items():
+        if k.startswith("loss."): # VAE stray data
+            del tens[k]
+        elif k.startswith("model_ema."): # Stable-Diffusion checkpoint model stray data
+            del tens[k]
+        elif type(v) != torch.Tensor:
+            raw_data = str(v)
+            if (len(raw_data) > 100):
+                raw_data = raw_data[:100] + "..."
+            print(f"discard {k} = {raw_data}")
+            del tens[k]
+    return save_file_streaming(tens, fname_clean + '.safetensors', metadata, fp16)
+
+def convert(path, file, fp16):
+    print(f"Will convert {file}...")
+    last_dot = file.rindex('.')
+    fname_clean = file[:last_dot]
+    # Kept in its own function so the (possibly memory-mapped) source is fully released before it gets moved
+    spec_hash = write_converted(file, fname_clean, fp16)
+    rel = os.path.relpath(file, path)
+    os.makedirs(os.path.dirname(f"{path}/backups/{rel}"), exist_ok=True)
+    os.rename(file, f"{path}/backups/{rel}")
+    return {"sha256": file_sha256(fname_clean + '.safetensors'), "modelspec.hash_sha256": spec_hash}
+
+def convert_job(path, file, fp16):
+    """Runs one conversion, returning (error, hashes) rather than raising, so a pool keeps going."""
+    try:
+        return None, convert(path, file, fp16)
     except Exception as e:
         print(f"Failed to convert {file}:")
         traceback.print_exc()
+        return f"{type(e).__name__}: {e}", None
+
+def file_stamp(file):
+    stat = os.stat(file)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_manifest(manifest_path, manifest):
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+def main():
+    fp16 = sys.argv[2].lower() == 'true'
+    path = sys.argv[1]
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else max(1, min(4, (os.cpu_count() or 1) // 2))
+    def get_all(ext):
+        return glob.glob(f"{path}/**/*.{ext}", recursive=True)
+    files = get_all('ckpt') + get_all('pt') + get_all('bin') + get_all('pth')
+    files = [file for file in files if '/backups/' not in file.replace('\\', '/')]
+
+    # The manifest records every file already converted, so an interrupted run over a big library picks up where it stopped
+    # (normally converted sources are moved into backups/, but a run killed mid-move, or a backup moved back, would otherwise be redone).
+    # Files that failed before are always tried again, so the convert button can retry them.
+    manifest_path = f"{path}/backups/{MANIFEST_NAME}"
+    os.makedirs(f"{path}/backups", exist_ok=True)
+    manifest = load_manifest(manifest_path)
+    hash_index_path = f"{path}/backups/{HASH_INDEX_NAME}"
+    hash_index = load_manifest(hash_index_path)
+    todo = []
+    skipped = 0
+    retried = 0
+    for file in files:
+        rel = os.path.relpath(file, path)
+        stamp = file_stamp(file)
+        entry = manifest.get(rel)
+        if entry is not None and entry["status"] == "failed":
+            print(f"Retrying {file}, which failed in a previous run: {entry['error']}")
+            retried += 1
+        elif entry is not None and entry["size"] == stamp["size"] and entry["mtime"] == stamp["mtime"]:
+            print(f"Skipping {file}, already converted in a previous run")
+            skipped += 1
+            continue
+        todo.append((file, stamp))
+
+    # Small files (embeddings, loras) convert in parallel, anything too big to share the memory budget runs alone
+    per_worker = MEMORY_BUDGET // workers
+    small = [(file, stamp) for file, stamp in todo if stamp["size"] * 2 <= per_worker]
+    large = [(file, stamp) for file, stamp in todo if stamp["size"] * 2 > per_worker]
+    start = time.time()
+    done_bytes = 0
+    counts = {"completed": 0, "failed": 0}
+    def record(file, stamp, result):
+        nonlocal done_bytes
+        error, hashes = result
+        status = "failed" if error else "completed"
+        counts[status] += 1
+        done_bytes += stamp["size"]
+        manifest[os.path.relpath(file, path)] = stamp | {"status": status, "error": error}
+        save_manifest(manifest_path, manifest)
+        if hashes:
+            hash_index[os.path.relpath(file[:file.rindex('.')] + '.safetensors', path).replace('\\', '/')] = hashes
+            save_manifest(hash_index_path, hash_index)
+    if small:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = {pool.submit(convert_job, path, file, fp16): (file, stamp) for file, stamp in small}
+            for job in as_completed(jobs):
+                record(*jobs[job], job.result())
+    for file, stamp in large:
+        record(file, stamp, convert_job(path, file, fp16))
+
+    elapsed = max(time.time() - start, 0.001)
+    megabytes = done_bytes / (1024 * 1024)
+    print(f"Converted {counts['completed']} files, {counts['failed']} failed ({retried} were retries of earlier failures), {skipped} skipped as already converted.")
+    print(f"Processed {megabytes:.1f} MB in {elapsed:.1f}s ({megabytes / elapsed:.1f} MB/s, {len(todo) / elapsed:.2f} files/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+import torch, comfy, folder_paths, os, json, mmap, struct, threading, time
+from collections import OrderedDict
+from nodes import CheckpointLoaderSimple
+from server import PromptServer
+from aiohttp import web
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8, "BOOL": torch.bool
+}
+if hasattr(torch, "float8_e4m3fn"):
+    SAFETENSORS_DTYPES |= {"F8_E4M3": torch.float8_e4m3fn, "F8_E5M2": torch.float8_e5m2}
+
+def load_safetensors_mmap(path):
+    """Loads a safetensors state dict as views onto a copy-on-write memory map of the file.
+    Tensor data is paged in from disk (or the OS page cache, shared between processes) only when it's actually read, and nothing is copied up front."""
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    base = 8 + header_len
+    sd = {}
+    for key, info in header.items():
+        if key == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            sd[key] = torch.empty(info["shape"], dtype=dtype)
+        else:
+            sd[key] = torch.frombuffer(data, dtype=dtype, count=(end - start) // dtype.itemsize, offset=base + start).reshape(info["shape"])
+    return sd
+
+def module_bytes(module):
+    return sum(t.nbytes for t in module.state_dict().values()) if module is not None else 0
+
+def checkpoint_bytes(result):
+    model, clip, vae = result
+    return module_bytes(getattr(model, "model", None)) + module_bytes(getattr(clip, "cond_stage_model", None)) + module_bytes(getattr(vae, "first_stage_model", None))
+
+class CheckpointCache:
+    """Process-wide LRU of loaded (MODEL, CLIP, VAE) checkpoints, bounded by the total size of their weights.
+    Comfy only keeps the most recent output of each node, so workflows with several checkpoint inputs, or a queue switching between a few models, otherwise reload from disk every time."""
+
+    def __init__(self, max_bytes, use_mmap):
+        self.max_bytes = max_bytes
+        self.use_mmap = use_mmap
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()
+
+    def key_for(self, name):
+        path = folder_paths.get_full_path("checkpoints", name)
+        stat = os.stat(path)
+        return path, (path, stat.st_size, stat.st_mtime)
+
+    def load_uncached(self, name, path):
+        if self.use_mmap and path.endswith(".safetensors") and hasattr(comfy.sd, "load_state_dict_guess_config"):
+            sd = load_safetensors_mmap(path)
+            out = comfy.sd.load_state_dict_guess_config(sd, output_vae=True, output_clip=True, embedding_directory=folder_paths.get_folder_paths("embeddings"))
+            return tuple(out[:3])
+        return tuple(CheckpointLoaderSimple().load_checkpoint(name)[:3])
+
+    def get(self, name):
+        path, key = self.key_for(name)
+        if self.max_bytes <= 0:
+            return self.load_uncached(name, path)
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result[0]
+        # Loads are serialized, so a warm-up running in the background and a prompt asking for the same model don't both read it
+        with self.load_lock:
+            with self.lock:
+                result = self.entries.get(key)
+                if result is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return result[0]
+                self.misses += 1
+            start = time.time()
+            result = self.load_uncached(name, path)
+            elapsed = time.time() - start
+            size = checkpoint_bytes(result)
+            with self.lock:
+                self.load_time += elapsed
+                if size <= self.max_bytes:
+                    self.entries[key] = (result, size)
+                    self.used_bytes += size
+                    while self.used_bytes > self.max_bytes:
+                        _, (_, old_size) = self.entries.popitem(last=False)
+                        self.used_bytes -= old_size
+            print(f"[SwarmInputCheckpoint] Loaded {name} ({size / (1024 * 1024):.0f} MB) in {elapsed:.2f}s")
+            return result
+
+    def warm_up(self, names):
+        if self.max_bytes <= 0:
+            print("[SwarmInputCheckpoint] Not preloading checkpoints, as the checkpoint cache is disabled (set SWARM_CHECKPOINT_CACHE_MB to enable it)")
+            return
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"[SwarmInputCheckpoint] Failed to preload {name}: {e}")
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": [key[0] for key in self.entries.keys()],
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0,
+                "load_time": self.load_time,
+                "mmap": self.use_mmap,
+            }
+
+
+# Off (pass-through) by default, as cached weights stay in RAM on top of what Comfy's model management keeps. See the ComfyUIBackend README
+CHECKPOINT_CACHE = CheckpointCache(int(os.environ.get("SWARM_CHECKPOINT_CACHE_MB", "0")) * 1024 * 1024, bool(os.environ.get("SWARM_CHECKPOINT_MMAP")))
+
+def start_warm_up(names):
+    names = [name.strip() for name in names if name.strip()]
+    if names:
+        threading.Thread(target=CHECKPOINT_CACHE.warm_up, args=(names,), daemon=True).start()
+    return names
+
+# Comma-separated checkpoint names to preload in the background when the backend starts
+start_warm_up(os.environ.get("SWARM_CHECKPOINT_WARMUP", "").split(","))
+
+@PromptServer.instance.routes.get("/swarm/checkpoint_cache_stats")
+async def checkpoint_cache_stats(request):
+    return web.json_response(CHECKPOINT_CACHE.stats())
+
+@PromptServer.instance.routes.post("/swarm/checkpoint_cache_warmup")
+async def checkpoint_cache_warmup(request):
+    data = await request.json()
+    return web.json_response({"preloading": start_warm_up(data.get("models", []))})
@@ -1,7 +1,6 @@
 import torch
 from PIL import Image
 import numpy as np
-from transformers import CLIPSegProcessor, CLIPSegForImageSegmentation
 import folder_paths
 import os, requests
 
@@ -45,6 +44,8 @@ class SwarmClipSeg:
     FUNCTION = "seg"
 
     def seg(self, images, match_text, threshold):
+        # Imported here rather than at load, as transformers is slow to import and most runs never use this node
+        from transformers import CLIPSegProcessor, CLIPSegForImageSegmentation
         # TODO: Batch support?
         i = 255.0 * images[0].cpu().numpy()
         img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
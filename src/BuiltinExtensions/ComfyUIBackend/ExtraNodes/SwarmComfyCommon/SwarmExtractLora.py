@@ -1,47 +1,125 @@
 import comfy.model_management
 import safetensors.torch
-import torch, os, comfy, json
+import torch, os, comfy, json, struct, shutil
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
 # ATTRIBUTION: This code is a mix of code from kohya-ss, comfy, and Swarm. It would be annoying to disentangle but it's all FOSS and relatively short so it's fine.
 
 CLAMP_QUANTILE = 0.99
-def extract_lora(diff, rank):
-    conv2d = (len(diff.shape) == 4)
-    kernel_size = None if not conv2d else diff.size()[2:4]
-    conv2d_3x3 = conv2d and kernel_size != (1, 1)
-    out_dim, in_dim = diff.size()[0:2]
-    rank = min(rank, in_dim, out_dim)
+# Use randomized low-rank SVD when the target rank is at most this fraction of the smaller matrix dimension
+LOWRANK_FRACTION = 0.25
+LOWRANK_OVERSAMPLE = 8
+# Cap on the size of one batch of same-shape diffs on the device
+MAX_GROUP_BYTES = 512 * 1024 * 1024
+# torch.quantile refuses inputs over 2^24 elements, so rows are passed to it in slices under that size
+QUANTILE_MAX_ELEMENTS = 16 * 1024 * 1024
+# Finished batches waiting on the host writer at once. Compute waits on the writer beyond this, so results can't pile up in memory
+MAX_PENDING_WRITES = 2
 
-    if conv2d:
-        if conv2d_3x3:
-            diff = diff.flatten(start_dim=1)
-        else:
-            diff = diff.squeeze()
+def extract_lora(diffs, rank):
+    """Extracts (up, down) LoRA pairs for a batch of same-shape weight diffs, shaped (batch, out, in[, kh, kw])."""
+    conv2d = (len(diffs.shape) == 5)
+    kernel_size = None if not conv2d else diffs.size()[3:5]
+    batch, out_dim, in_dim = diffs.size()[0:3]
+    rank = min(rank, in_dim, out_dim)
 
-    U, S, Vh = torch.linalg.svd(diff.float())
-    U = U[:, :rank]
-    S = S[:rank]
-    U = U @ torch.diag(S)
-    Vh = Vh[:rank, :]
+    # 3x3 convs flatten to (out, in*kh*kw), 1x1 convs and linears are just (out, in)
+    diffs = diffs.flatten(start_dim=2).float()
+    min_dim = min(diffs.shape[1], diffs.shape[2])
+    if rank <= min_dim * LOWRANK_FRACTION:
+        U, S, V = torch.svd_lowrank(diffs, q=min(rank + LOWRANK_OVERSAMPLE, min_dim))
+        Vh = V.transpose(1, 2)
+    else:
+        U, S, Vh = torch.linalg.svd(diffs, full_matrices=False)
+    U = U[:, :, :rank] * S[:, None, :rank]
+    Vh = Vh[:, :rank, :]
 
-    dist = torch.cat([U.flatten(), Vh.flatten()])
-    hi_val = torch.quantile(dist, CLAMP_QUANTILE)
+    dist = torch.cat([U.flatten(start_dim=1), Vh.flatten(start_dim=1)], dim=1)
+    rows_per_call = max(1, QUANTILE_MAX_ELEMENTS // dist.shape[1])
+    hi_val = torch.cat([torch.quantile(rows, CLAMP_QUANTILE, dim=1) for rows in dist.split(rows_per_call)]).view(batch, 1, 1)
     low_val = -hi_val
 
     U = U.clamp(low_val, hi_val)
     Vh = Vh.clamp(low_val, hi_val)
     if conv2d:
-        U = U.reshape(out_dim, rank, 1, 1)
-        Vh = Vh.reshape(rank, in_dim, kernel_size[0], kernel_size[1])
+        U = U.reshape(batch, out_dim, rank, 1, 1)
+        Vh = Vh.reshape(batch, rank, in_dim, kernel_size[0], kernel_size[1])
     return (U, Vh)
 
 
-def do_lora_handle(base_data, other_data, rank, prefix, require, do_bias, callback):
+def group_chunks(entries):
+    chunk, size = [], 0
+    for entry in entries:
+        entry_size = entry[1].numel() * 4
+        if chunk and size + entry_size > MAX_GROUP_BYTES:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(entry)
+        size += entry_size
+    if chunk:
+        yield chunk
+
+
+class SafetensorsStreamWriter:
+    """Writes a safetensors file one tensor at a time, so the full output never needs to be held in memory.
+    Tensor data is streamed to a side file as it arrives, then placed behind the header (which needs every offset) on close."""
+    DTYPES = {torch.float16: "F16", torch.bfloat16: "BF16", torch.float32: "F32"}
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = metadata
+        self.header = {}
+        self.offset = 0
+        self.data_path = f"{path}.data.tmp"
+        self.data_file = open(self.data_path, "wb")
+
+    def write(self, name, tensor):
+        data = tensor.contiguous().cpu().reshape(-1).view(torch.uint8).numpy().tobytes()
+        self.header[name] = {"dtype": self.DTYPES[tensor.dtype], "shape": list(tensor.shape), "data_offsets": [self.offset, self.offset + len(data)]}
+        self.data_file.write(data)
+        self.offset += len(data)
+
+    def close(self):
+        self.data_file.close()
+        header = {"__metadata__": {k: str(v) for k, v in self.metadata.items()}} | self.header
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header_bytes += b" " * ((8 - len(header_bytes) % 8) % 8)
+        try:
+            with open(self.path, "wb") as f:
+                f.write(struct.pack("<Q", len(header_bytes)))
+                f.write(header_bytes)
+                with open(self.data_path, "rb") as data:
+                    shutil.copyfileobj(data, f, 64 * 1024 * 1024)
+        except:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            raise
+        finally:
+            os.remove(self.data_path)
+
+    def abort(self):
+        """Discards everything written so far, for when extraction fails partway."""
+        self.data_file.close()
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+
+
+def do_lora_handle(base_data, other_data, rank, prefix, require, do_bias, callback, device=None, write=None):
+    """Extracts LoRA data for all keys that differ between the two state dicts.
+    Same-shape weights are diffed, checked and decomposed together in batches on the device, while finished results are copied back to the host on a background thread.
+    'device' can be overridden (eg to 'cpu') to run without a GPU.
+    If 'write' is given, each finished tensor is passed to it as it completes (and the returned dict is empty), otherwise results are collected and returned."""
     out_data = {}
-    device = comfy.model_management.get_torch_device()
+    if write is None:
+        def write(name, tensor):
+            out_data[name] = tensor
+    if device is None:
+        device = comfy.model_management.get_torch_device()
+    groups = {}
     for key in base_data.keys():
-        callback()
         if key not in other_data:
+            callback()
             continue
         base_tensor = base_data[key]
         other_tensor = other_data[key]
@@ -52,34 +130,66 @@ def do_lora_handle(base_data, other_data, rank, prefix, require, do_bias, callba
         if require:
             if not key.startswith(require):
                 print(f"Ignore unmatched key {key} (doesn't match {require})")
+                callback()
                 continue
             key = key[len(require):]
         if base_tensor.shape != other_tensor.shape:
-            continue
-        diff = other_tensor.to(device) - base_tensor.to(device)
-        other_tensor = other_tensor.cpu()
-        base_tensor = base_tensor.cpu()
-        max_diff = float(diff.abs().max())
-        if max_diff < 1e-5:
-            print(f"discard unaltered key {key} ({max_diff})")
+            callback()
             continue
         if key.endswith(".weight"):
             fixed_key = key[:-len(".weight")].replace('.', '_')
             name = f"lora_{prefix}_{fixed_key}"
-            if len(base_tensor.shape) >= 2:
-                print(f"extract key {name} ({max_diff})")
-                out = extract_lora(diff, rank)
-                out_data[f"{name}.lora_up.weight"] = out[0].contiguous().half().cpu()
-                out_data[f"{name}.lora_down.weight"] = out[1].contiguous().half().cpu()
-            else:
-                print(f"ignore valid raw pass-through key {name} ({max_diff})")
-                #out_data[name] = other_tensor.contiguous().half().cpu()
+            if len(base_tensor.shape) < 2:
+                print(f"ignore raw pass-through key {name}")
+                callback()
+                continue
+            kind = "weight"
         elif key.endswith(".bias") and do_bias:
             fixed_key = key[:-len(".bias")].replace('.', '_')
             name = f"lora_{prefix}_{fixed_key}"
-            print(f"extract bias key {name} ({max_diff})")
-            out_data[f"{name}.diff_b"] = diff.contiguous().half().cpu()
+            kind = "bias"
+        else:
+            callback()
+            continue
+        groups.setdefault((kind, tuple(base_tensor.shape)), []).append((name, base_tensor, other_tensor))
+
+    def store(names, results):
+        for name, result in zip(names, results):
+            write(name, result.contiguous().half().cpu())
 
+    writes = deque()
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        def submit_write(names, results):
+            while len(writes) >= MAX_PENDING_WRITES:
+                writes.popleft().result()
+            writes.append(writer.submit(store, names, results))
+
+        for (kind, _), entries in groups.items():
+            for chunk in group_chunks(entries):
+                diffs = torch.stack([other.to(device) - base.to(device) for _, base, other in chunk])
+                # One host sync for the whole chunk, rather than one per key
+                max_diffs = diffs.flatten(start_dim=1).abs().amax(dim=1).tolist()
+                keep = []
+                for i, (name, _, _) in enumerate(chunk):
+                    if max_diffs[i] < 1e-5:
+                        print(f"discard unaltered key {name} ({max_diffs[i]})")
+                    else:
+                        print(f"extract {kind} key {name} ({max_diffs[i]})")
+                        keep.append(i)
+                names = [chunk[i][0] for i in keep]
+                if len(keep) > 0:
+                    if len(keep) != len(chunk):
+                        diffs = diffs[keep]
+                    if kind == "bias":
+                        submit_write([f"{name}.diff_b" for name in names], diffs)
+                    else:
+                        up, down = extract_lora(diffs, rank)
+                        submit_write([f"{name}.lora_up.weight" for name in names] + [f"{name}.lora_down.weight" for name in names], list(up) + list(down))
+                for _ in chunk:
+                    callback()
+        # Surface any failure in the background writes (eg disk full), rather than saving a file with tensors missing
+        while writes:
+            writes.popleft().result()
 
     return out_data
 
@@ -100,6 +210,9 @@ class SwarmExtractLora:
                 "save_filename": ("STRING", {"multiline": False}),
                 "save_clip": ("BOOLEAN", {"default": True}),
                 "metadata": ("STRING", {"multiline": True}),
+            },
+            "optional": {
+                "stream_to_disk": ("BOOLEAN", {"default": True}),
             }
         }
 
@@ -108,12 +221,14 @@ class SwarmExtractLora:
     FUNCTION = "extract_lora"
     OUTPUT_NODE = True
 
-    def extract_lora(self, base_model, base_model_clip, other_model, other_model_clip, rank, save_rawpath, save_filename, save_clip, metadata):
+    def extract_lora(self, base_model, base_model_clip, other_model, other_model_clip, rank, save_rawpath, save_filename, save_clip, metadata, stream_to_disk=True):
         base_data = base_model.model_state_dict()
         other_data = other_model.model_state_dict()
         key_count = len(base_data.keys())
         if save_clip:
-            key_count += len(base_model_clip.get_sd().keys())
+            base_clip_data = base_model_clip.get_sd()
+            other_clip_data = other_model_clip.get_sd()
+            key_count += len(base_clip_data.keys()) * 2
         pbar = comfy.utils.ProgressBar(key_count)
         class Helper:
             steps = 0
@@ -121,12 +236,6 @@ class SwarmExtractLora:
                 self.steps += 1
                 pbar.update_absolute(self.steps, key_count, None)
         helper = Helper()
-        out_data = do_lora_handle(base_data, other_data, rank, "unet", "diffusion_model.", True, lambda: helper.callback())
-        if save_clip:
-            # TODO: CLIP keys get wonky, this probably doesn't work? Model-arch-dependent.
-            out_clip = do_lora_handle(base_model_clip.get_sd(), other_model_clip.get_sd(), rank, "te_text_model_encoder_layers", "0.transformer.text_model.encoder.layers.", False, lambda: helper.callback())
-            out_clip = do_lora_handle(base_model_clip.get_sd(), other_model_clip.get_sd(), rank, "te2_text_model_encoder_layers", "1.transformer.text_model.encoder.layers.", False, lambda: helper.callback())
-            out_data.update(out_clip)
 
         # Can't easily autodetect all the correct modelspec info, but at least supply some basics
         out_metadata = {
@@ -136,8 +245,25 @@ class SwarmExtractLora:
         if metadata:
             out_metadata.update(json.loads(metadata))
         path = f"{save_rawpath}{save_filename}.safetensors"
+        writer = SafetensorsStreamWriter(path, out_metadata) if stream_to_disk else None
+        write = writer.write if writer else None
+
+        try:
+            out_data = do_lora_handle(base_data, other_data, rank, "unet", "diffusion_model.", True, lambda: helper.callback(), write=write)
+            if save_clip:
+                # TODO: CLIP keys get wonky, this probably doesn't work? Model-arch-dependent.
+                out_data.update(do_lora_handle(base_clip_data, other_clip_data, rank, "te_text_model_encoder_layers", "0.transformer.text_model.encoder.layers.", False, lambda: helper.callback(), write=write))
+                out_data.update(do_lora_handle(base_clip_data, other_clip_data, rank, "te2_text_model_encoder_layers", "1.transformer.text_model.encoder.layers.", False, lambda: helper.callback(), write=write))
+        except:
+            if writer:
+                writer.abort()
+            raise
+
         print(f"saving to path {path}")
-        safetensors.torch.save_file(out_data, path, metadata=out_metadata)
+        if writer:
+            writer.close()
+        else:
+            safetensors.torch.save_file(out_data, path, metadata=out_metadata)
         return ()
 
 NODE_CLASS_MAPPINGS = {
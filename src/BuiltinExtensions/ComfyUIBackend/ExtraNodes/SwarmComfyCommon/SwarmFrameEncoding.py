@@ -0,0 +1,32 @@
+from PIL import Image
+import torch, time
+
+# Frame conversion helpers shared by the animation save nodes in both Swarm node packages.
+# SwarmComfyExtra loads this file by path (see SwarmComfyExtra/SwarmCommonImport.py), so it must stay self-contained, with no relative imports.
+
+# How many frames to convert to uint8 at a time, keeps peak memory to a few frames rather than the whole clip
+CHUNK_FRAMES = 4
+
+
+def images_to_uint8_chunks(images, chunk_size=CHUNK_FRAMES):
+    for start in range(0, images.shape[0], chunk_size):
+        chunk = images[start:start + chunk_size]
+        if hasattr(chunk, "materialize"): # Lazy FrameSequence view from the Swarm video nodes
+            chunk = chunk.materialize()
+        yield (chunk * 255.).clamp(0, 255).to(torch.uint8).cpu().numpy()
+
+
+def images_to_pil_frames(images):
+    for chunk in images_to_uint8_chunks(images):
+        for frame in chunk:
+            yield Image.fromarray(frame)
+
+
+def save_animated_image(out, images, fps, format, node_name, **kwargs):
+    """Encodes an animated webp/gif from frames converted to uint8 a chunk at a time, avoiding a full-clip float->uint8 copy.
+    Pillow itself still gathers every appended frame (WebP lists them before encoding, GIF keeps them while encoding), so all frames end up held as 8-bit PIL images."""
+    start = time.time()
+    frames = images_to_pil_frames(images)
+    next(frames).save(out, save_all=True, duration=int(1000.0 / fps), append_images=frames, format=format, **kwargs)
+    elapsed = max(time.time() - start, 0.001)
+    print(f"[{node_name}] Encoded {images.shape[0]} frames as {format} in {elapsed:.2f}s ({images.shape[0] / elapsed:.1f} fps)")
@@ -1,6 +1,55 @@
 import torch
-import comfy
-import math
+import math, os, functools
+from torch.nn import functional as F
+
+LANCZOS_A = 3
+# Rough memory budget for one chunk of a batch resize, so huge batches are processed a slice at a time instead of spiking memory
+RESIZE_BUDGET = int(os.environ.get("SWARM_RESIZE_BUDGET_MB", "1024")) * 1024 * 1024
+
+@functools.lru_cache(maxsize=16)
+def lanczos_weights(in_size, out_size, device):
+    """Dense (out_size, in_size) Lanczos resampling matrix for one axis. When shrinking the kernel is widened by the scale factor, which is what antialiases it."""
+    scale = out_size / in_size
+    filter_scale = min(scale, 1.0)
+    support = math.ceil(LANCZOS_A / filter_scale)
+    centers = (torch.arange(out_size, dtype=torch.float64) + 0.5) / scale - 0.5
+    index = centers.floor()[:, None] + torch.arange(-support, support + 1, dtype=torch.float64)[None, :]
+    x = (index - centers[:, None]) * filter_scale
+    weights = torch.sinc(x) * torch.sinc(x / LANCZOS_A) * (x.abs() < LANCZOS_A)
+    weights /= weights.sum(1, keepdim=True)
+    matrix = torch.zeros((out_size, in_size), dtype=torch.float64)
+    # Taps past the edges are clamped onto the edge pixels
+    matrix.scatter_add_(1, index.clamp(0, in_size - 1).long(), weights)
+    return matrix.to(device=device, dtype=torch.float32)
+
+def resize_chunk(images, width, height, mode):
+    """Resizes a BHWC chunk, returning BHWC. Everything stays channel-last: permuting BHWC gives an NCHW view in channels_last layout, which interpolate keeps."""
+    batch, old_height, old_width, channels = images.shape
+    if mode == "lanczos":
+        out = torch.matmul(lanczos_weights(old_height, height, images.device), images.reshape(batch, old_height, old_width * channels))
+        out = torch.matmul(lanczos_weights(old_width, width, images.device), out.reshape(batch * height, old_width, channels))
+        return out.reshape(batch, height, width, channels).clamp_(0, 1)
+    samples = images.permute(0, 3, 1, 2)
+    if mode == "area" and width <= old_width and height <= old_height:
+        out = F.interpolate(samples, size=(height, width), mode="area")
+    elif mode == "bilinear":
+        out = F.interpolate(samples, size=(height, width), mode="bilinear")
+    else:
+        # "area" when growing, where averaging does nothing useful
+        out = F.interpolate(samples, size=(height, width), mode="bilinear", antialias=True)
+    return out.permute(0, 2, 3, 1)
+
+def resize_images(images, width, height, mode):
+    """Resizes an IMAGE batch, a chunk at a time within RESIZE_BUDGET, writing into a single preallocated output."""
+    batch, old_height, old_width, channels = images.shape
+    per_image = max(old_height * old_width, height * width, old_height * width, height * old_width) * channels * 4 * 3
+    chunk_size = max(1, RESIZE_BUDGET // per_image)
+    if chunk_size >= batch:
+        return resize_chunk(images, width, height, mode)
+    result = images.new_empty((batch, height, width, channels))
+    for i in range(0, batch, chunk_size):
+        result[i:i + chunk_size] = resize_chunk(images[i:i + chunk_size], width, height, mode)
+    return result
 
 class SwarmImageScaleForMP:
     @classmethod
@@ -11,6 +60,9 @@ class SwarmImageScaleForMP:
                 "width": ("INT", {"default": 0, "min": 0, "max": 8192}),
                 "height": ("INT", {"default": 0, "min": 0, "max": 8192}),
                 "can_shrink": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "mode": (["bilinear", "area", "lanczos", "antialiased_bilinear"], )
             }
         }
 
@@ -18,7 +70,7 @@ class SwarmImageScaleForMP:
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "scale"
 
-    def scale(self, image, width, height, can_shrink):
+    def scale(self, image, width, height, can_shrink, mode="bilinear"):
         mpTarget = width * height
         oldWidth = image.shape[2]
         oldHeight = image.shape[1]
@@ -28,9 +80,7 @@ class SwarmImageScaleForMP:
             return (image,)
         newWid = int(round(oldWidth * scale / 64) * 64)
         newHei = int(round(oldHeight * scale / 64) * 64)
-        samples = image.movedim(-1, 1)
-        s = comfy.utils.common_upscale(samples, newWid, newHei, "bilinear", "disabled")
-        s = s.movedim(1, -1)
+        s = resize_images(image, newWid, newHei, mode)
         return (s,)
 
 class SwarmImageCrop:
@@ -58,6 +108,50 @@ class SwarmImageCrop:
         img = image[:, y:to_y, x:to_x, :]
         return (img,)
 
+class FrameSequence:
+    """Lazy view of a frame tensor in some order (eg reversed, looped or boomeranged), holding only an index list rather than copies of the frames.
+    Slicing gives another view, and frames are only materialized (a slice at a time) when an encoder consumes them.
+    Only Swarm's own save nodes understand this, so the video nodes return it only when their `lazy` input is set."""
+    def __init__(self, frames, indices):
+        self.frames = frames
+        self.indices = indices
+
+    @property
+    def shape(self):
+        return torch.Size((len(self.indices),) + tuple(self.frames.shape[1:]))
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return FrameSequence(self.frames, self.indices[key])
+        return self.frames[self.indices[key]]
+
+    def __iter__(self):
+        for i in self.indices.tolist():
+            yield self.frames[i]
+
+    def materialize(self):
+        return self.frames.index_select(0, self.indices.to(self.frames.device))
+
+def frame_view(images, indices):
+    """Views images (a tensor or FrameSequence) in the given frame order, composing with any existing view rather than nesting."""
+    if isinstance(images, FrameSequence):
+        return FrameSequence(images.frames, images.indices[indices])
+    return FrameSequence(images, indices)
+
+def frame_output(images, indices, lazy):
+    view = frame_view(images, indices)
+    # A single gather when materializing, rather than building the pieces and concatenating them
+    return (view if lazy else view.materialize(),)
+
+VIDEO_OPTIONAL_INPUTS = {
+    "optional": {
+        "lazy": ("BOOLEAN", {"default": False})
+    }
+}
+
 class SwarmVideoBoomerang:
     @classmethod
     def INPUT_TYPES(s):
@@ -65,19 +159,54 @@ class SwarmVideoBoomerang:
             "required": {
                 "images": ("IMAGE",),
             }
-        }
+        } | VIDEO_OPTIONAL_INPUTS
 
     CATEGORY = "StableSwarmUI/video"
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "boomerang"
 
-    def boomerang(self, images):
+    def boomerang(self, images, lazy=False):
         # return images followed by  reverse images
-        images = torch.cat((images, images.flip(0)), 0)
-        return (images,)
+        forward = torch.arange(images.shape[0])
+        return frame_output(images, torch.cat((forward, forward.flip(0))), lazy)
+
+class SwarmVideoReverse:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+            }
+        } | VIDEO_OPTIONAL_INPUTS
+
+    CATEGORY = "StableSwarmUI/video"
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "reverse"
+
+    def reverse(self, images, lazy=False):
+        return frame_output(images, torch.arange(images.shape[0]).flip(0), lazy)
+
+class SwarmVideoLoop:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "images": ("IMAGE",),
+                "loops": ("INT", {"default": 2, "min": 1, "max": 1024}),
+            }
+        } | VIDEO_OPTIONAL_INPUTS
+
+    CATEGORY = "StableSwarmUI/video"
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "loop"
+
+    def loop(self, images, loops, lazy=False):
+        return frame_output(images, torch.arange(images.shape[0]).repeat(loops), lazy)
 
 NODE_CLASS_MAPPINGS = {
     "SwarmImageScaleForMP": SwarmImageScaleForMP,
     "SwarmImageCrop": SwarmImageCrop,
     "SwarmVideoBoomerang": SwarmVideoBoomerang,
+    "SwarmVideoReverse": SwarmVideoReverse,
+    "SwarmVideoLoop": SwarmVideoLoop,
 }
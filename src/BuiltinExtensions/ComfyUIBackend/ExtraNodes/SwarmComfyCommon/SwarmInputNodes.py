@@ -1,6 +1,6 @@
 from . import SwarmLoadImageB64
-import folder_paths
-from nodes import CheckpointLoaderSimple
+from .SwarmModelIndex import cached_filename_list
+from .SwarmCheckpointCache import CHECKPOINT_CACHE
 
 INT_MAX = 0xffffffffffffffff
 INT_MIN = -INT_MAX
@@ -130,7 +130,7 @@ class SwarmInputCheckpoint:
         return {
             "required": {
                 "title": ("STRING", {"default": "My Checkpoint Model Name Input"}),
-                "value": (folder_paths.get_filename_list("checkpoints"),),
+                "value": (cached_filename_list("checkpoints"),),
             } | STANDARD_REQ_INPUTS,
         } | STANDARD_OTHER_INPUTS
 
@@ -139,7 +139,7 @@ class SwarmInputCheckpoint:
     FUNCTION = "do_input"
 
     def do_input(self, value, **kwargs):
-        return CheckpointLoaderSimple().load_checkpoint(value)
+        return CHECKPOINT_CACHE.get(value)
 
 
 class SwarmInputDropdown:
@@ -1,4 +1,5 @@
 import comfy, folder_paths, execution
+from .SwarmModelIndex import cached_filename_list
 
 # This is purely a hack to provide a list of embeds in the object_info report.
 # Code referenced from Comfy VAE impl. Probably does nothing useful in an actual workflow.
@@ -7,7 +8,7 @@ class SwarmEmbedLoaderListProvider:
     def INPUT_TYPES(s):
         return {
             "required": {
-                "embed_name": (folder_paths.get_filename_list("embeddings"), )
+                "embed_name": (cached_filename_list("embeddings"), )
             }
         }
 
@@ -15,6 +15,11 @@ class SwarmOffsetEmptyLatentImage:
                 "off_c": ("INT", {"default": 0, "min": -10, "max": 10, "step": 0.0001}),
                 "off_d": ("INT", {"default": 0, "min": -10, "max": 10, "step": 0.0001}),
                 "batch_size": ("INT", {"default": 1, "min": 1, "max": 4096})
+            },
+            "optional": {
+                "model": ("MODEL", ),
+                "dtype": (["default", "float32", "float16", "bfloat16"], ),
+                "device": (["intermediate", "gpu"], )
             }
         }
 
@@ -22,12 +27,20 @@ class SwarmOffsetEmptyLatentImage:
     RETURN_TYPES = ("LATENT",)
     FUNCTION = "generate"
 
-    def generate(self, width, height, off_a, off_b, off_c, off_d, batch_size=1):
-        latent = torch.zeros([batch_size, 4, height // 8, width // 8], device=self.device)
-        latent[:, 0, :, :] = off_a
-        latent[:, 1, :, :] = off_b
-        latent[:, 2, :, :] = off_c
-        latent[:, 3, :, :] = off_d
+    def generate(self, width, height, off_a, off_b, off_c, off_d, batch_size=1, model=None, dtype="default", device="intermediate"):
+        channels, downscale = 4, 8
+        if model is not None:
+            # Newer latent formats (eg SD3, Flux) have more channels, and some video models a different spatial factor
+            latent_format = model.get_model_object("latent_format")
+            channels = latent_format.latent_channels
+            downscale = getattr(latent_format, "spacial_downscale_ratio", 8)
+        target = comfy.model_management.get_torch_device() if device == "gpu" else self.device
+        dtype = torch.float32 if dtype == "default" else getattr(torch, dtype)
+        # Offsets past the fourth channel are zero
+        offsets = ([off_a, off_b, off_c, off_d] + [0] * channels)[:channels]
+        latent = torch.empty([batch_size, channels, height // downscale, width // downscale], device=target, dtype=dtype)
+        # One broadcast write of the per-channel offsets fills the whole batch, rather than zeroing then writing each channel
+        latent.copy_(torch.tensor(offsets, dtype=dtype, device=target).view(1, channels, 1, 1))
         return ({"samples":latent}, )
 
 
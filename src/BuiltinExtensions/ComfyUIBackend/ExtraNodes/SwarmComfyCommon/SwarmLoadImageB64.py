@@ -1,20 +1,96 @@
 from PIL import Image, ImageOps
 import numpy as np
-import torch, base64, io
+import torch, base64, io, hashlib, os, threading
+from collections import OrderedDict
+from server import PromptServer
+from aiohttp import web
+
+EXIF_ORIENTATION = 0x0112
+
+
+class DecodedImageCache:
+    """Process-wide LRU of decoded IMAGE/MASK tensors keyed by a hash of the base64 payload.
+    Swarm resends the same init image, mask or controlnet reference for every prompt in a batch or grid, and Comfy's own cache misses whenever anything else in the workflow changes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += sum(t.nbytes for t in result)
+            return result
+
+    def put(self, key, result):
+        size = sum(t.nbytes for t in result)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = result
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.used_bytes -= sum(t.nbytes for t in old)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total > 0 else 0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+# Off by default, as cached images stay in RAM, the same as the checkpoint cache. See the ComfyUIBackend README
+IMAGE_CACHE = DecodedImageCache(int(os.environ.get("SWARM_IMAGE_CACHE_MB", "0")) * 1024 * 1024)
+
+@PromptServer.instance.routes.get("/swarm/image_cache_stats")
+async def image_cache_stats(request):
+    return web.json_response(IMAGE_CACHE.stats())
+
+def uint8_to_float(data):
+    """Converts a uint8 HWC array to a float32 tensor in 0-1, allocating only the output."""
+    return torch.from_numpy(data).to(torch.float32).div_(255.0)
 
 def b64_to_img_and_mask(image_base64):
+    key = None
+    if IMAGE_CACHE.max_bytes > 0:
+        key = hashlib.sha1(image_base64.encode("utf-8")).digest()
+        cached = IMAGE_CACHE.get(key)
+        if cached is not None:
+            return cached
     imageData = base64.b64decode(image_base64)
     i = Image.open(io.BytesIO(imageData))
-    i = ImageOps.exif_transpose(i)
-    image = i.convert("RGB")
-    image = np.array(image).astype(np.float32) / 255.0
-    image = torch.from_numpy(image)[None,]
+    if i.getexif().get(EXIF_ORIENTATION, 1) != 1:
+        i = ImageOps.exif_transpose(i)
+    image = uint8_to_float(np.array(i.convert("RGB")))[None,]
     if 'A' in i.getbands():
-        mask = np.array(i.getchannel('A')).astype(np.float32) / 255.0
-        mask = 1. - torch.from_numpy(mask)
+        # 1 - (a / 255), done in place on the single float copy
+        mask = uint8_to_float(np.array(i.getchannel('A'))).neg_().add_(1.0)
     else:
         mask = torch.zeros((64,64), dtype=torch.float32, device="cpu")
-    return (image, mask.unsqueeze(0))
+    result = (image, mask.unsqueeze(0))
+    if key is not None:
+        IMAGE_CACHE.put(key, result)
+    return result
 
 class SwarmLoadImageB64:
     @classmethod
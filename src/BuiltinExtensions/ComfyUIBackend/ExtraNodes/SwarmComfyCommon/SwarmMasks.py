@@ -1,4 +1,4 @@
-import torch
+import torch, comfy, functools
 
 class SwarmSquareMaskFromPercent:
     @classmethod
@@ -19,23 +19,39 @@ class SwarmSquareMaskFromPercent:
 
     def mask_from_perc(self, x, y, width, height, strength):
         SCALE = 256
-        mask = torch.zeros((SCALE, SCALE), dtype=torch.float32, device="cpu")
-        mask[int(y*SCALE):int((y+height)*SCALE), int(x*SCALE):int((x+width)*SCALE)] = strength
-        return (mask,)
+        return (rects_to_mask([(x, y, width, height, strength)], SCALE, SCALE),)
+
+
+# Rectangle masks remember the rectangles they were drawn from as a 'swarm_rects' list of (x, y, width, height, strength) percentages.
+# That lets them be redrawn sharp at whatever resolution they get matched to, rather than bicubic upscaled from the small default size,
+# and lets sums of rectangle masks stay symbolic.
+def rects_to_mask(rects, height, width, device="cpu"):
+    mask = torch.zeros((height, width), dtype=torch.float32, device=device)
+    for x, y, w, h, strength in rects:
+        mask[int(y*height):int((y+h)*height), int(x*width):int((x+w)*width)] += strength
+    mask.swarm_rects = rects
+    return mask
+
+
+def resize_mask(mask, height, width, device=None):
+    rects = getattr(mask, "swarm_rects", None)
+    if len(mask.shape) == 2:
+        mask = mask.unsqueeze(0)
+    if device is not None:
+        mask = mask.to(device)
+    if mask.shape[1] == height and mask.shape[2] == width:
+        return mask
+    if rects is not None:
+        resized = rects_to_mask(rects, height, width, mask.device).unsqueeze(0)
+        resized.swarm_rects = rects
+        return resized
+    return torch.nn.functional.interpolate(mask.unsqueeze(0), size=(height, width), mode="bicubic")[0]
 
 
 def mask_size_match(mask_a, mask_b):
-    if len(mask_a.shape) == 2:
-        mask_a = mask_a.unsqueeze(0)
-    if len(mask_b.shape) == 2:
-        mask_b = mask_b.unsqueeze(0)
-    height = max(mask_a.shape[1], mask_b.shape[1])
-    width = max(mask_a.shape[2], mask_b.shape[2])
-    if mask_a.shape[1] != height or mask_a.shape[2] != width:
-        mask_a = torch.nn.functional.interpolate(mask_a.unsqueeze(0), size=(height, width), mode="bicubic")[0]
-    if mask_b.shape[1] != height or mask_b.shape[2] != width:
-        mask_b = torch.nn.functional.interpolate(mask_b.unsqueeze(0), size=(height, width), mode="bicubic")[0]
-    return (mask_a, mask_b)
+    height = max(mask_a.shape[-2], mask_b.shape[-2])
+    width = max(mask_a.shape[-1], mask_b.shape[-1])
+    return (resize_mask(mask_a, height, width), resize_mask(mask_b, height, width))
 
 
 class SwarmOverMergeMasksForOverlapFix:
@@ -53,6 +69,12 @@ class SwarmOverMergeMasksForOverlapFix:
     FUNCTION = "mask_overmerge"
 
     def mask_overmerge(self, mask_a, mask_b):
+        rects_a, rects_b = getattr(mask_a, "swarm_rects", None), getattr(mask_b, "swarm_rects", None)
+        if rects_a is not None and rects_b is not None and mask_a.shape[-2:] == mask_b.shape[-2:]:
+            # Batched like the raster path's output, with the rects re-attached since unsqueeze makes a new tensor
+            mask = rects_to_mask(rects_a + rects_b, mask_a.shape[-2], mask_a.shape[-1]).unsqueeze(0)
+            mask.swarm_rects = rects_a + rects_b
+            return (mask,)
         mask_a, mask_b = mask_size_match(mask_a, mask_b)
         mask_sum = mask_a + mask_b
         return (mask_sum,)
@@ -123,6 +145,77 @@ class SwarmExcludeFromMask:
         return (main_mask,)
 
 
+MAX_REGION_MASKS = 16
+
+class SwarmNormalizeRegionMasks:
+    """Does the work of a chain of SwarmOverMergeMasksForOverlapFix, SwarmExcludeFromMask and SwarmCleanOverlapMasksExceptSelf nodes in one pass.
+    Outputs each input mask normalized against the overlap of all masks, followed by the background mask (the area no region covers)."""
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "mask_1": ("MASK",),
+            },
+            "optional": {f"mask_{i}": ("MASK",) for i in range(2, MAX_REGION_MASKS + 1)}
+        }
+
+    CATEGORY = "StableSwarmUI/masks"
+    RETURN_TYPES = ("MASK",) * (MAX_REGION_MASKS + 1)
+    RETURN_NAMES = tuple(f"mask_{i}" for i in range(1, MAX_REGION_MASKS + 1)) + ("background",)
+    FUNCTION = "normalize"
+
+    def normalize(self, **kwargs):
+        masks = [kwargs.get(f"mask_{i}") for i in range(1, MAX_REGION_MASKS + 1)]
+        present = [m for m in masks if m is not None]
+        device = comfy.model_management.get_torch_device()
+        height = max(m.shape[-2] for m in present)
+        width = max(m.shape[-1] for m in present)
+        batch = max(m.shape[0] if len(m.shape) == 3 else 1 for m in present)
+        stacked = torch.empty((len(present), batch, height, width), dtype=torch.float32, device=device)
+        for i, m in enumerate(present):
+            stacked[i] = resize_mask(m, height, width, device)
+        merged = stacked.sum(dim=0)
+        background = (1.0 - merged).clamp_(0.0, 1.0)
+        cleaned = stacked / merged.clamp(1.0, 9999.0)
+        out_device = comfy.model_management.intermediate_device()
+        cleaned = cleaned.to(out_device)
+        results = []
+        index = 0
+        for m in masks:
+            if m is None:
+                results.append(None)
+            else:
+                results.append(cleaned[index])
+                index += 1
+        return tuple(results) + (background.to(out_device),)
+
+
+def mask_bounds(mask, grow):
+    """Returns a list of (x, y, width, height) boxes, one per mask in the batch, computed in one pass with a single host transfer."""
+    if len(mask.shape) == 2:
+        mask = mask.unsqueeze(0)
+    height, width = mask.shape[1], mask.shape[2]
+    sum_x = (torch.sum(mask, dim=1) != 0).to(dtype=torch.int)
+    sum_y = (torch.sum(mask, dim=2) != 0).to(dtype=torch.int)
+    edges = torch.stack([sum_x.argmax(dim=1), sum_x.flip(1).argmax(dim=1), sum_y.argmax(dim=1), sum_y.flip(1).argmax(dim=1)], dim=1) - grow
+    boxes = []
+    for x_start, x_end, y_start, y_end in edges.tolist():
+        x_start = max(0, min(x_start, width - 1))
+        x_end = width - max(0, min(x_end, width - 1))
+        y_start = max(0, min(y_start, height - 1))
+        y_end = height - max(0, min(y_end, height - 1))
+        boxes.append((x_start, y_start, x_end - x_start, y_end - y_start))
+    return boxes
+
+
+def union_bounds(boxes):
+    x_start = min(box[0] for box in boxes)
+    y_start = min(box[1] for box in boxes)
+    x_end = max(box[0] + box[2] for box in boxes)
+    y_end = max(box[1] + box[3] for box in boxes)
+    return (x_start, y_start, x_end - x_start, y_end - y_start)
+
+
 class SwarmMaskBounds:
     @classmethod
     def INPUT_TYPES(s):
@@ -130,6 +223,9 @@ class SwarmMaskBounds:
             "required": {
                 "mask": ("MASK",),
                 "grow": ("INT", {"default": 0, "min": 0, "max": 1024})
+            },
+            "optional": {
+                "mode": (["first", "union"],)
             }
         }
 
@@ -138,30 +234,54 @@ class SwarmMaskBounds:
     RETURN_NAMES = ("x", "y", "width", "height")
     FUNCTION = "get_bounds"
 
-    def get_bounds(self, mask, grow):
+    def get_bounds(self, mask, grow, mode="first"):
+        if mode == "union":
+            return union_bounds(mask_bounds(mask, grow))
         if len(mask.shape) == 3:
             mask = mask[0]
-        sum_x = (torch.sum(mask, dim=0) != 0).to(dtype=torch.int)
-        sum_y = (torch.sum(mask, dim=1) != 0).to(dtype=torch.int)
-        def getval(arr, direction):
-            val = torch.argmax(arr).item()
-            val += grow * direction
-            val = max(0, min(val, arr.shape[0] - 1))
-            return val
-        x_start = getval(sum_x, -1)
-        x_end = mask.shape[1] - getval(sum_x.flip(0), -1)
-        y_start = getval(sum_y, -1)
-        y_end = mask.shape[0] - getval(sum_y.flip(0), -1)
-        return (int(x_start), int(y_start), int(x_end - x_start), int(y_end - y_start))
-
-
-# Blur code is copied out of ComfyUI's default ImageBlur
-def gaussian_kernel(kernel_size: int, sigma: float, device=None):
-    x, y = torch.meshgrid(torch.linspace(-1, 1, kernel_size, device=device), torch.linspace(-1, 1, kernel_size, device=device), indexing="ij")
-    d = torch.sqrt(x * x + y * y)
-    g = torch.exp(-(d * d) / (2.0 * sigma * sigma))
+        return mask_bounds(mask, grow)[0]
+
+
+class SwarmMaskBoundsBatch:
+    """Bounds of every mask in a batch, output as lists so downstream nodes run once per mask."""
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "mask": ("MASK",),
+                "grow": ("INT", {"default": 0, "min": 0, "max": 1024})
+            }
+        }
+
+    CATEGORY = "StableSwarmUI/masks"
+    RETURN_TYPES = ("INT", "INT", "INT", "INT")
+    RETURN_NAMES = ("x", "y", "width", "height")
+    OUTPUT_IS_LIST = (True, True, True, True)
+    FUNCTION = "get_bounds"
+
+    def get_bounds(self, mask, grow):
+        boxes = mask_bounds(mask, grow)
+        return tuple([box[i] for box in boxes] for i in range(4))
+
+
+# Blur math originally from ComfyUI's default ImageBlur. Its 2D gaussian is separable, so it's done as two 1D passes
+@functools.lru_cache(maxsize=64)
+def gaussian_kernel_1d(kernel_size: int, sigma: float, device=None):
+    x = torch.linspace(-1, 1, kernel_size, device=device)
+    g = torch.exp(-(x * x) / (2.0 * sigma * sigma))
     return g / g.sum()
 
+# Above this radius, FFT convolution beats direct 1D convolution
+FFT_BLUR_RADIUS = 24
+
+def conv_last_dim(x, kernel):
+    """'Valid' convolution of a (B, H, W) tensor along its last dim with a symmetric 1D kernel."""
+    if kernel.shape[0] // 2 >= FFT_BLUR_RADIUS:
+        n = x.shape[-1] + kernel.shape[0] - 1
+        out = torch.fft.irfft(torch.fft.rfft(x, n=n) * torch.fft.rfft(kernel, n=n), n=n)
+        return out[..., kernel.shape[0] - 1 : x.shape[-1]]
+    return torch.nn.functional.conv1d(x.reshape(-1, 1, x.shape[-1]), kernel.view(1, 1, -1)).view(*x.shape[:-1], -1)
+
 
 class SwarmMaskBlur:
     def __init__(self):
@@ -185,14 +305,12 @@ class SwarmMaskBlur:
     def blur(self, mask, blur_radius, sigma):
         if blur_radius == 0:
             return (mask,)
-        kernel_size = blur_radius * 2 + 1
-        kernel = gaussian_kernel(kernel_size, sigma, device=mask.device).repeat(1, 1, 1).unsqueeze(1)
-        while mask.ndim < 4:
-            mask = mask.unsqueeze(0)
-        padded_mask = torch.nn.functional.pad(mask, (blur_radius,blur_radius,blur_radius,blur_radius), 'reflect')
-        blurred = torch.nn.functional.conv2d(padded_mask, kernel, padding=kernel_size // 2, groups=1)[:,:,blur_radius:-blur_radius, blur_radius:-blur_radius]
-        blurred = blurred.squeeze(0).squeeze(0)
-        return (blurred,)
+        kernel = gaussian_kernel_1d(blur_radius * 2 + 1, sigma, device=mask.device)
+        batch = mask.reshape(-1, 1, mask.shape[-2], mask.shape[-1])
+        padded = torch.nn.functional.pad(batch, (blur_radius, blur_radius, blur_radius, blur_radius), 'reflect')[:, 0]
+        blurred = conv_last_dim(padded, kernel)
+        blurred = conv_last_dim(blurred.transpose(-1, -2), kernel).transpose(-1, -2)
+        return (blurred.reshape(mask.shape),)
 
 
 class SwarmMaskThreshold:
@@ -226,7 +344,9 @@ NODE_CLASS_MAPPINGS = {
     "SwarmCleanOverlapMasksExceptSelf": SwarmCleanOverlapMasksExceptSelf,
     "SwarmExcludeFromMask": SwarmExcludeFromMask,
     "SwarmOverMergeMasksForOverlapFix": SwarmOverMergeMasksForOverlapFix,
+    "SwarmNormalizeRegionMasks": SwarmNormalizeRegionMasks,
     "SwarmMaskBounds": SwarmMaskBounds,
+    "SwarmMaskBoundsBatch": SwarmMaskBoundsBatch,
     "SwarmMaskBlur": SwarmMaskBlur,
     "SwarmMaskThreshold": SwarmMaskThreshold,
 }
@@ -0,0 +1,78 @@
+import os, time, threading
+import folder_paths
+
+# Minimum seconds between revalidations of a folder, so a burst of object_info builds costs one round of stat calls
+REVALIDATE_INTERVAL = 2.0
+EXCLUDED_DIRS = [".git"]
+
+class FolderIndex:
+    """Incrementally refreshed listing of one model folder type (eg "checkpoints") across all of its configured paths.
+    Each directory's entries are cached alongside its mtime, so a refresh only stats the known directories and relists the ones that changed,
+    rather than walking the whole tree. On large network-mounted model libraries a full walk can take many seconds."""
+
+    def __init__(self, folder_name):
+        self.folder_name = folder_name
+        self.dirs = {}
+        self.files = []
+        self.last_checked = 0
+        self.lock = threading.Lock()
+
+    def list_dir(self, path, mtime):
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if entry.name not in EXCLUDED_DIRS:
+                            subdirs.append(entry.path)
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            pass
+        return (mtime, files, subdirs)
+
+    def refresh(self):
+        paths, extensions = folder_paths.folder_names_and_paths[self.folder_name][:2]
+        dirs = {}
+        changed = False
+        found = set()
+        for root in paths:
+            # Tracked per root, so a root nested inside another still lists its files relative to itself. Listings are shared through dirs
+            visited = set()
+            stack = [root]
+            while stack:
+                path = stack.pop()
+                if path in visited:
+                    continue
+                visited.add(path)
+                entry = dirs.get(path)
+                if entry is None:
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except OSError:
+                        continue
+                    entry = self.dirs.get(path)
+                    if entry is None or entry[0] != mtime:
+                        entry = self.list_dir(path, mtime)
+                        changed = True
+                    dirs[path] = entry
+                stack.extend(entry[2])
+                found.update(os.path.relpath(os.path.join(path, name), root) for name in entry[1])
+        if changed or dirs.keys() != self.dirs.keys():
+            self.files = folder_paths.filter_files_extensions(found, extensions)
+        self.dirs = dirs
+
+    def get(self):
+        with self.lock:
+            if time.time() - self.last_checked >= REVALIDATE_INTERVAL:
+                self.refresh()
+                self.last_checked = time.time()
+            return self.files
+
+INDEXES = {}
+
+def cached_filename_list(folder_name):
+    """Drop-in for folder_paths.get_filename_list, backed by an incrementally refreshed FolderIndex."""
+    if folder_name not in folder_paths.folder_names_and_paths:
+        return folder_paths.get_filename_list(folder_name)
+    return INDEXES.setdefault(folder_name, FolderIndex(folder_name)).get()
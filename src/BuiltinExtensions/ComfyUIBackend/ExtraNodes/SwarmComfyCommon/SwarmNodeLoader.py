@@ -0,0 +1,18 @@
+import importlib, os, sys, time
+
+def load_node_modules(package_name, module_names):
+    """Imports each named node module from the given package, returning their merged NODE_CLASS_MAPPINGS and per-module import cost in seconds.
+    The import times are kept to watch backend startup time. Set SWARM_REPORT_IMPORT_TIMES=1 to log them.
+    Self-contained, so SwarmComfyExtra can load it through SwarmCommonImport."""
+    import_times = {}
+    node_class_mappings = {}
+    for name in module_names:
+        start = time.perf_counter()
+        module = importlib.import_module(f".{name}", package_name)
+        import_times[name] = time.perf_counter() - start
+        node_class_mappings |= module.NODE_CLASS_MAPPINGS
+    if os.environ.get("SWARM_REPORT_IMPORT_TIMES"):
+        # Comfy may register the package under its full path, so label it by its folder name
+        label = os.path.basename(os.path.dirname(sys.modules[package_name].__file__))
+        print(f"[{label}] Import times: {', '.join(f'{name}={t * 1000:.1f}ms' for name, t in sorted(import_times.items(), key=lambda x: -x[1]))}")
+    return node_class_mappings, import_times
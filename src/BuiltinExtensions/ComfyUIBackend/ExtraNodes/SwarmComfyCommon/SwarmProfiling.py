@@ -0,0 +1,81 @@
+import torch, time, os, threading, functools
+import nodes
+from server import PromptServer
+from aiohttp import web
+
+# Opt-in per-node profiling of all Swarm nodes, enabled by setting SWARM_NODE_PROFILING=1.
+# Nodes are wrapped on the first prompt rather than at load, so nodes from every Swarm package (loaded in any order) are covered.
+ENABLED = bool(os.environ.get("SWARM_NODE_PROFILING"))
+STATS = {}
+STATS_LOCK = threading.Lock()
+
+def output_bytes(value, depth=0):
+    if isinstance(value, torch.Tensor):
+        return value.nbytes
+    if depth > 3:
+        return 0
+    if isinstance(value, (list, tuple)):
+        return sum(output_bytes(v, depth + 1) for v in value)
+    if isinstance(value, dict):
+        return sum(output_bytes(v, depth + 1) for v in value.values())
+    return 0
+
+def record(name, wall, sync, peak, out_bytes):
+    with STATS_LOCK:
+        stat = STATS.setdefault(name, {"calls": 0, "total_time": 0.0, "max_time": 0.0, "sync_time": 0.0, "peak_allocated": 0, "output_bytes": 0})
+        stat["calls"] += 1
+        stat["total_time"] += wall
+        stat["max_time"] = max(stat["max_time"], wall)
+        stat["sync_time"] += sync
+        stat["peak_allocated"] = max(stat["peak_allocated"], peak)
+        stat["output_bytes"] += out_bytes
+
+def profile_function(name, func):
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        cuda = torch.cuda.is_available()
+        if cuda:
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        sync = 0.0
+        peak = 0
+        if cuda:
+            sync_start = time.perf_counter()
+            torch.cuda.synchronize()
+            sync = time.perf_counter() - sync_start
+            peak = torch.cuda.max_memory_allocated()
+        record(name, time.perf_counter() - start, sync, peak, output_bytes(result))
+        return result
+    wrapped.swarm_profiled = True
+    return wrapped
+
+def instrument_nodes(mappings):
+    for name, cls in mappings.items():
+        if not name.startswith("Swarm"):
+            continue
+        func = getattr(cls, cls.FUNCTION, None)
+        if func is None or getattr(func, "swarm_profiled", False):
+            continue
+        setattr(cls, cls.FUNCTION, profile_function(name, func))
+
+def report():
+    with STATS_LOCK:
+        result = {}
+        for name, stat in sorted(STATS.items(), key=lambda x: -x[1]["total_time"]):
+            result[name] = stat | {"avg_time": stat["total_time"] / stat["calls"]}
+        return {"enabled": ENABLED, "nodes": result}
+
+if ENABLED:
+    def on_prompt(json_data):
+        instrument_nodes(nodes.NODE_CLASS_MAPPINGS)
+        return json_data
+    PromptServer.instance.add_on_prompt_handler(on_prompt)
+
+@PromptServer.instance.routes.get("/swarm/node_profile")
+async def node_profile(request):
+    data = report()
+    if request.rel_url.query.get("reset", "false") == "true":
+        with STATS_LOCK:
+            STATS.clear()
+    return web.json_response(data)
@@ -20,34 +20,34 @@ class SwarmReferenceOnly:
 
     def reference_only(self, model, reference, latent):
         model_reference = model.clone()
-        reference["samples"] = torch.nn.functional.interpolate(reference["samples"], size=(latent["samples"].shape[2], latent["samples"].shape[3]), mode="bilinear")
+        reference_samples = torch.nn.functional.interpolate(reference["samples"], size=(latent["samples"].shape[2], latent["samples"].shape[3]), mode="bilinear")
+        ref_count = reference_samples.shape[0]
 
-        batch = latent["samples"].shape[0] + reference["samples"].shape[0]
+        batch = latent["samples"].shape[0] + ref_count
         def reference_apply(q, k, v, extra_options):
-            k = k.clone().repeat(1, 2, 1)
-            offset = 0
-            if q.shape[0] > batch:
-                offset = batch
-
-            for o in range(0, q.shape[0], batch):
-                for x in range(1, batch):
-                    k[x + o, q.shape[1]:] = q[o,:]
-
+            # Each batch group is [references..., latents...]. Latents attend to their own keys plus the queries of every reference in their group,
+            # references just see their own keys repeated, so the whole extension is built with one broadcast rather than per-sample loops.
+            tokens, dim = k.shape[1], k.shape[2]
+            grouped_q = q.reshape(-1, batch, q.shape[1], q.shape[2])
+            grouped_k = k.reshape(-1, batch, tokens, dim)
+            extension = grouped_q[:, None, :ref_count].reshape(-1, 1, ref_count * tokens, dim).expand(-1, batch, -1, -1).clone()
+            extension[:, :ref_count] = grouped_k[:, :ref_count].repeat(1, 1, ref_count, 1)
+            k = torch.cat((grouped_k, extension), dim=2).reshape(k.shape[0], -1, dim)
             return q, k, k
 
         model_reference.set_model_attn1_patch(reference_apply)
-        out_latent = torch.cat((reference["samples"], latent["samples"]))
+        out_latent = torch.cat((reference_samples, latent["samples"]))
         if "noise_mask" in latent:
             mask = latent["noise_mask"]
         else:
-            mask = torch.ones((64,64), dtype=torch.float32, device="cpu")
+            mask = torch.ones((latent["samples"].shape[2], latent["samples"].shape[3]), dtype=torch.float32, device=latent["samples"].device)
 
         if len(mask.shape) < 3:
             mask = mask.unsqueeze(0)
         if mask.shape[0] < latent["samples"].shape[0]:
             mask = mask.repeat(latent["samples"].shape[0], 1, 1)
 
-        out_mask = torch.zeros((1,mask.shape[1],mask.shape[2]), dtype=torch.float32, device="cpu")
+        out_mask = torch.zeros((ref_count, mask.shape[1], mask.shape[2]), dtype=torch.float32, device=mask.device)
         return (model_reference, {"samples": out_latent, "noise_mask": torch.cat((out_mask, mask))})
 
 NODE_CLASS_MAPPINGS = {
@@ -3,6 +3,7 @@ import numpy as np
 import comfy.utils
 from server import PromptServer, BinaryEventTypes
 import time, io, struct
+from .SwarmFrameEncoding import save_animated_image
 
 SPECIAL_ID = 12345 # Tells swarm that the node is going to output final images
 VIDEO_ID = 12346
@@ -59,17 +60,11 @@ class SwarmSaveAnimatedWebpWS:
 
     def save_images(self, images, fps, lossless, quality, method):
         method = self.methods.get(method)
-        pil_images = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
-
         out = io.BytesIO()
         type_num = 3
         header = struct.pack(">I", type_num)
         out.write(header)
-        pil_images[0].save(out, save_all=True, duration=int(1000.0/fps), append_images=pil_images[1 : len(pil_images)], lossless=lossless, quality=quality, method=method, format='WEBP')
+        save_animated_image(out, images, fps, 'WEBP', "SwarmSaveAnimatedWebpWS", lossless=lossless, quality=quality, method=method)
         out.seek(0)
         preview_bytes = out.getvalue()
         server = PromptServer.instance
@@ -1,29 +1,106 @@
-import torch, copy
+import torch, copy, time, weakref
+from contextlib import contextmanager
 from torch.nn import functional as F
 
+def pad_assym(input, left, right, top, bottom, mode):
+    """Pads circularly along one axis and with zeros along the other, writing straight into a single output allocation.
+    Matches the result of a circular F.pad followed by a constant F.pad (or vice versa for y_circular) exactly."""
+    height, width = input.shape[-2], input.shape[-1]
+    padded = input.new_empty(input.shape[:-2] + (height + top + bottom, width + left + right))
+    padded[..., top:top + height, left:left + width] = input
+    if mode == "x_circular":
+        padded[..., top:top + height, :left] = input[..., width - left:]
+        padded[..., top:top + height, left + width:] = input[..., :right]
+        padded[..., :top, :] = 0
+        padded[..., top + height:, :] = 0
+    else:
+        padded[..., :top, left:left + width] = input[..., height - top:, :]
+        padded[..., top + height:, left:left + width] = input[..., :bottom, :]
+        padded[..., :left] = 0
+        padded[..., left + width:] = 0
+    return padded
+
+def assym_conv_forward(self, input, weight, bias):
+    if self.padding_mode == "x_circular" or self.padding_mode == "y_circular":
+        left, right, top, bottom = self._reversed_padding_repeated_twice
+        padded = pad_assym(input, left, right, top, bottom, self.padding_mode)
+        return F.conv2d(padded, weight, bias, self.stride, (0, 0), self.dilation, self.groups)
+    elif self.padding_mode != "zeros":
+        padded = F.pad(input, self._reversed_padding_repeated_twice, mode=self.padding_mode)
+        return F.conv2d(padded, weight, bias, self.stride, (0, 0), self.dilation, self.groups)
+    else:
+        return F.conv2d(input, weight, bias, self.stride, self.padding, self.dilation, self.groups)
+
 def make_circular_assym(m, assym_mode):
-    def _conv_forward(self, input, weight, bias):
-        if self.padding_mode == "x_circular":
-            padded = F.pad(input, (self._reversed_padding_repeated_twice[0], self._reversed_padding_repeated_twice[1], 0, 0), "circular")
-            padded = F.pad(padded, (0, 0, self._reversed_padding_repeated_twice[2], self._reversed_padding_repeated_twice[3]), "constant", 0)
-            return F.conv2d(padded, weight, bias, self.stride, (0, 0), self.dilation, self.groups)
-        elif self.padding_mode == "y_circular":
-            padded = F.pad(input, (self._reversed_padding_repeated_twice[0], self._reversed_padding_repeated_twice[1], 0, 0), "constant", 0)
-            padded = F.pad(padded, (0, 0, self._reversed_padding_repeated_twice[2], self._reversed_padding_repeated_twice[3]), "circular")
-            return F.conv2d(padded, weight, bias, self.stride, (0, 0), self.dilation, self.groups)
-        elif self.padding_mode != "zeros":
-            padded = F.pad(input, self._reversed_padding_repeated_twice, mode=self.padding_mode)
-            return F.conv2d(padded, weight, bias, self.stride, (0, 0), self.dilation, self.groups)
-        else:
-            return F.conv2d(input, weight, bias, self.stride, self.padding, self.dilation, self.groups)
     if isinstance(m, torch.nn.Conv2d):
-        m._conv_forward = _conv_forward.__get__(m, torch.nn.Conv2d)
+        m._conv_forward = assym_conv_forward.__get__(m, torch.nn.Conv2d)
         m.padding_mode = assym_mode
 
 def make_circular(m):
     if isinstance(m, torch.nn.Conv2d):
         m.padding_mode = "circular"
 
+def tile_axis_to_mode(tile_axis):
+    if tile_axis == "X":
+        return "x_circular"
+    elif tile_axis == "Y":
+        return "y_circular"
+    return "circular"
+
+@contextmanager
+def tiled_padding(convs, mode):
+    """Temporarily switches the given (shared) conv modules to a tiling padding mode, restoring them afterward.
+    This lets tiled variants of a model share weights with the original, only differing in padding while they run."""
+    originals = [(m, m.padding_mode, m.__dict__.get("_conv_forward")) for m in convs]
+    for m in convs:
+        if mode == "circular":
+            make_circular(m)
+        else:
+            make_circular_assym(m, mode)
+    try:
+        yield
+    finally:
+        for m, padding_mode, conv_forward in originals:
+            m.padding_mode = padding_mode
+            if conv_forward is not None:
+                m._conv_forward = conv_forward
+            elif "_conv_forward" in m.__dict__:
+                del m._conv_forward
+
+def find_convs(module):
+    return [m for m in module.modules() if isinstance(m, torch.nn.Conv2d)]
+
+def tiling_object_patches(module, mode):
+    """Object patches (attribute path -> value) that switch every conv in the module to the given tiling padding mode.
+    Applied through a ModelPatcher, they're set when that patcher is loaded and restored when it's unloaded, so tiling stays with the clone
+    regardless of what other patches or wrappers later nodes add."""
+    patches = {}
+    for name, m in module.named_modules():
+        if isinstance(m, torch.nn.Conv2d):
+            patches[f"{name}.padding_mode"] = mode
+            if mode != "circular":
+                patches[f"{name}._conv_forward"] = assym_conv_forward.__get__(m, torch.nn.Conv2d)
+    return patches
+
+# Tiled VAE variants, keyed weakly by the source vae and then by mode, so toggling tiling is free after the first time
+TILED_VAES = weakref.WeakKeyDictionary()
+
+class TiledModuleProxy:
+    """Stands in for a VAE's first_stage_model, applying tiled padding to the shared module around encode/decode calls."""
+    def __init__(self, module, mode):
+        self.module = module
+        self.mode = mode
+        self.convs = find_convs(module)
+
+    def __getattr__(self, name):
+        attr = getattr(self.module, name)
+        if name not in ["encode", "decode"]:
+            return attr
+        def wrapped(*args, **kwargs):
+            with tiled_padding(self.convs, self.mode):
+                return attr(*args, **kwargs)
+        return wrapped
+
 class SwarmModelTiling:
     @classmethod
     def INPUT_TYPES(s):
@@ -41,14 +118,14 @@ class SwarmModelTiling:
     FUNCTION = "adapt"
 
     def adapt(self, model, tile_axis=None):
-        m = copy.deepcopy(model)
-        if tile_axis is not None and tile_axis != "Both":
-            if tile_axis == "X":
-                m.model.apply(lambda x: make_circular_assym(x, "x_circular"))
-            elif tile_axis == "Y":
-                m.model.apply(lambda x: make_circular_assym(x, "y_circular"))
-        else:
-            m.model.apply(make_circular)
+        mode = tile_axis_to_mode(tile_axis)
+        start = time.time()
+        # A clone shares weights with the source model, the tiling is only applied while this clone is the one loaded
+        m = model.clone()
+        patches = tiling_object_patches(m.model, mode)
+        for key, value in patches.items():
+            m.add_object_patch(key, value)
+        print(f"[SwarmModelTiling] Patched {len(patches)} conv attributes for {mode} tiling in {time.time() - start:.3f}s, sharing weights with the source model")
         return (m,)
 
 class SwarmTileableVAE:
@@ -68,15 +145,16 @@ class SwarmTileableVAE:
     FUNCTION = "adapt"
 
     def adapt(self, vae, tile_axis=None):
-        vae = copy.deepcopy(vae)
-        if tile_axis is not None and tile_axis != "Both":
-            if tile_axis == "X":
-                vae.first_stage_model.apply(lambda x: make_circular_assym(x, "x_circular"))
-            elif tile_axis == "Y":
-                vae.first_stage_model.apply(lambda x: make_circular_assym(x, "y_circular"))
-        else:
-            vae.first_stage_model.apply(make_circular)
-        return (vae,)
+        mode = tile_axis_to_mode(tile_axis)
+        variants = TILED_VAES.setdefault(vae, {})
+        if mode in variants:
+            return (variants[mode],)
+        start = time.time()
+        tiled = copy.copy(vae)
+        tiled.first_stage_model = TiledModuleProxy(vae.first_stage_model, mode)
+        variants[mode] = tiled
+        print(f"[SwarmTileableVAE] Patched {len(tiled.first_stage_model.convs)} conv layers for {mode} tiling in {time.time() - start:.3f}s, sharing weights with the source VAE")
+        return (tiled,)
 
 NODE_CLASS_MAPPINGS = {
     "SwarmModelTiling": SwarmModelTiling,
@@ -1,6 +1,47 @@
-import torch, comfy
+import torch, comfy, hashlib, weakref
+from collections import OrderedDict
 from .SwarmKSampler import make_swarm_sampler_callback
 
+# Reversed sigma schedules, keyed by model type and sampling range + scheduler + steps, and whether the sampler changes the schedule
+INVERTED_SIGMAS = {}
+# Recently unsampled latents, so repeated edits of the same source image can skip the inversion pass
+INVERSION_CACHE = OrderedDict()
+INVERSION_CACHE_SIZE = 8
+
+def get_inverted_sigmas(model, sampler_name, scheduler, steps, device):
+    model_sampling = model.get_model_object("model_sampling")
+    # Some samplers (dpm_2, uni_pc, ...) get an extra step with the penultimate sigma dropped, so their schedule differs at the same step count
+    discard_penultimate = sampler_name in comfy.samplers.KSampler.DISCARD_PENULTIMATE_SIGMA_SAMPLERS
+    key = (type(model.model).__name__, type(model_sampling).__name__, float(model_sampling.sigma_min), float(model_sampling.sigma_max), scheduler, steps, discard_penultimate)
+    sigmas = INVERTED_SIGMAS.get(key)
+    if sigmas is None:
+        sampler = comfy.samplers.KSampler(model, steps=steps, device=device, sampler=sampler_name, scheduler=scheduler, denoise=1.0, model_options=model.model_options)
+        sigmas = sampler.sigmas.flip(0) + 0.0001
+        INVERTED_SIGMAS[key] = sigmas
+    return sigmas
+
+def hash_tensor(hasher, tensor):
+    hasher.update(str((tensor.shape, tensor.dtype)).encode("utf-8"))
+    hasher.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes())
+
+def inversion_key(latent_image, positive, negative, steps, sampler_name, scheduler, start_at_step):
+    hasher = hashlib.sha1()
+    hash_tensor(hasher, latent_image["samples"])
+    if "noise_mask" in latent_image:
+        hash_tensor(hasher, latent_image["noise_mask"])
+    for cond in positive + [None] + negative:
+        if cond is None:
+            hasher.update(b"|")
+            continue
+        hash_tensor(hasher, cond[0])
+        for name, val in sorted(cond[1].items()):
+            hasher.update(name.encode("utf-8"))
+            if isinstance(val, torch.Tensor):
+                hash_tensor(hasher, val)
+            else:
+                hasher.update(repr(val).encode("utf-8"))
+    return (hasher.hexdigest(), steps, sampler_name, scheduler, start_at_step)
+
 class SwarmUnsampler:
     @classmethod
     def INPUT_TYPES(s):
@@ -15,6 +56,9 @@ class SwarmUnsampler:
                 "latent_image": ("LATENT", ),
                 "start_at_step": ("INT", {"default": 0, "min": 0, "max": 10000}),
                 "previews": (["default", "none", "one"], )
+            },
+            "optional": {
+                "cache_inversion": ("BOOLEAN", {"default": False}),
             }
         }
 
@@ -22,23 +66,36 @@ class SwarmUnsampler:
     RETURN_TYPES = ("LATENT",)
     FUNCTION = "unsample"
 
-    def unsample(self, model, steps, sampler_name, scheduler, positive, negative, latent_image, start_at_step, previews):
+    def unsample(self, model, steps, sampler_name, scheduler, positive, negative, latent_image, start_at_step, previews, cache_inversion=False):
+        if cache_inversion:
+            key = inversion_key(latent_image, positive, negative, steps, sampler_name, scheduler, start_at_step)
+            cached = INVERSION_CACHE.get(key)
+            # The model is compared by identity, so a reloaded model or changed loras never reuses a stale inversion
+            if cached is not None and cached[0]() is model:
+                INVERSION_CACHE.move_to_end(key)
+                out = latent_image.copy()
+                out["samples"] = cached[1].clone()
+                return (out, )
+
         device = comfy.model_management.get_torch_device()
-        latent_samples = latent_image["samples"].to(device)
+        latent_samples = latent_image["samples"]
 
-        noise = torch.zeros(latent_samples.size(), dtype=latent_samples.dtype, layout=latent_samples.layout, device=device)
+        noise = torch.zeros(latent_samples.size(), dtype=latent_samples.dtype, layout=latent_samples.layout, device="cpu")
         noise_mask = None
         if "noise_mask" in latent_image:
             noise_mask = latent_image["noise_mask"]
 
-        sampler = comfy.samplers.KSampler(model, steps=steps, device=device, sampler=sampler_name, scheduler=scheduler, denoise=1.0, model_options=model.model_options)
-        sigmas = sampler.sigmas.flip(0) + 0.0001
+        sigmas = get_inverted_sigmas(model, sampler_name, scheduler, steps, device)
 
         callback = make_swarm_sampler_callback(steps, device, model, previews)
 
         samples = comfy.sample.sample(model, noise, steps, 1, sampler_name, scheduler, positive, negative, latent_samples,
                                     denoise=1.0, disable_noise=False, start_step=0, last_step=steps - start_at_step,
                                     force_full_denoise=False, noise_mask=noise_mask, sigmas=sigmas, callback=callback, seed=0)
+        if cache_inversion:
+            INVERSION_CACHE[key] = (weakref.ref(model), samples.cpu())
+            while len(INVERSION_CACHE) > INVERSION_CACHE_SIZE:
+                INVERSION_CACHE.popitem(last=False)
         out = latent_image.copy()
         out["samples"] = samples
         return (out, )
@@ -0,0 +1,14 @@
+import importlib.util, os, sys
+
+COMMON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SwarmComfyCommon")
+
+def import_common_module(name):
+    """Loads a self-contained helper module from SwarmComfyCommon by file path.
+    Comfy loads the two Swarm node packages as unrelated top-level modules, in no fixed order, so a normal import between them isn't possible."""
+    key = f"swarm_common_{name}"
+    if key not in sys.modules:
+        spec = importlib.util.spec_from_file_location(key, os.path.join(COMMON_DIR, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[key] = module
+        spec.loader.exec_module(module)
+    return sys.modules[key]
@@ -1,7 +1,6 @@
 from PIL import Image
 import numpy as np
 import torch
-from rembg import remove
 
 class SwarmRemBg:
     @classmethod
@@ -17,6 +16,8 @@ class SwarmRemBg:
     FUNCTION = "rem"
 
     def rem(self, images):
+        # Imported here rather than at load, as rembg is slow to import and most runs never use this node
+        from rembg import remove
         output = []
         masks = []
         for image in images:
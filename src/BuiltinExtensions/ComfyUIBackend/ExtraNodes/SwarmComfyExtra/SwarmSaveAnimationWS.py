@@ -1,12 +1,94 @@
-from PIL import Image
-import numpy as np
 from server import PromptServer, BinaryEventTypes
-import io, struct, subprocess, os, random, sys, time
-from imageio_ffmpeg import get_ffmpeg_exe
-import folder_paths
+import io, struct, subprocess, sys, time, threading, os, functools, errno
+from concurrent.futures import ThreadPoolExecutor
+from .SwarmCommonImport import import_common_module
+
+frame_encoding = import_common_module("SwarmFrameEncoding")
+images_to_uint8_chunks = frame_encoding.images_to_uint8_chunks
+save_animated_image = frame_encoding.save_animated_image
 
 VIDEO_ID = 12346
-FFMPEG_PATH = get_ffmpeg_exe()
+# Segmented encoding isn't worth the extra processes for short clips
+MIN_SEGMENT_FRAMES = 16
+# Per-codec encoder speed options, "default" leaves ffmpeg's own defaults in place
+SPEED_PRESETS = {
+    "default": {},
+    "fastest": {"libx264": ["-preset", "ultrafast"], "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "8", "-row-mt", "1"]},
+    "fast": {"libx264": ["-preset", "veryfast"], "libvpx-vp9": ["-deadline", "realtime", "-cpu-used", "5", "-row-mt", "1"]},
+    "slow": {"libx264": ["-preset", "slow"], "libvpx-vp9": ["-deadline", "best"]},
+}
+
+
+@functools.cache
+def get_ffmpeg_path():
+    # Resolved on first use rather than at load, as the lookup can be slow and most runs never encode video
+    from imageio_ffmpeg import get_ffmpeg_exe
+    return get_ffmpeg_exe()
+
+
+def is_closed_pipe_error(e):
+    # Writing to a pipe whose reader has exited is a BrokenPipeError on most platforms, but an EINVAL OSError on Windows
+    return isinstance(e, BrokenPipeError) or (isinstance(e, OSError) and e.errno == errno.EINVAL)
+
+
+def ffmpeg_encode_stream(args, chunks):
+    """Runs ffmpeg with raw frames piped into stdin and the muxed output read back from stdout, without touching disk."""
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+    feed_errors = []
+    def feed():
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except Exception as e:
+            # A closed pipe means ffmpeg died early, the error will be in stderr.
+            # Anything else (eg OOM while converting frames) is kept, as ffmpeg would otherwise exit cleanly with a truncated video
+            if not is_closed_pipe_error(e):
+                feed_errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError as e:
+                if not is_closed_pipe_error(e):
+                    feed_errors.append(e)
+    def drain_errors():
+        errors.append(process.stderr.read())
+    feeder = threading.Thread(target=feed, daemon=True)
+    err_reader = threading.Thread(target=drain_errors, daemon=True)
+    feeder.start()
+    err_reader.start()
+    output = process.stdout.read()
+    process.wait()
+    feeder.join()
+    err_reader.join()
+    if errors[0]:
+        print(errors[0].decode("utf-8"), file=sys.stderr)
+    # ffmpeg's own failure takes priority, as it's usually the cause of any error feeding it
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, output, errors[0])
+    if feed_errors:
+        raise feed_errors[0]
+    return output
+
+
+def raw_input_args(images, fps):
+    return [get_ffmpeg_path(), "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{images.shape[2]}x{images.shape[1]}", "-r", str(fps), "-i", "-"]
+
+
+def encode_frames(images, args):
+    return ffmpeg_encode_stream(args, (chunk.tobytes() for chunk in images_to_uint8_chunks(images)))
+
+
+def encode_h264_segmented(images, fps, codec_args, segments):
+    """Encodes separate slices of the clip in concurrent ffmpeg processes as MPEG-TS, which can be byte-concatenated, then remuxes the result to mp4 without re-encoding."""
+    bounds = [(images.shape[0] * i) // segments for i in range(segments + 1)]
+    def encode_segment(i):
+        args = raw_input_args(images, fps) + codec_args + ["-output_ts_offset", str(bounds[i] / fps), "-f", "mpegts", "-"]
+        return encode_frames(images[bounds[i]:bounds[i + 1]], args)
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        parts = list(executor.map(encode_segment, range(segments)))
+    args = [get_ffmpeg_path(), "-v", "error", "-f", "mpegts", "-i", "-", "-c", "copy", "-movflags", "frag_keyframe+empty_moov", "-f", "mp4", "-"]
+    return ffmpeg_encode_stream(args, parts)
 
 
 class SwarmSaveAnimationWS:
@@ -23,6 +105,11 @@ class SwarmSaveAnimationWS:
                 "method": (list(s.methods.keys()),),
                 "format": (["webp", "gif", "h264-mp4", "webm", "prores"],),
             },
+            "optional": {
+                "speed": (list(SPEED_PRESETS.keys()),),
+                "threads": ("INT", {"default": 0, "min": 0, "max": 256}),
+                "segments": ("INT", {"default": 1, "min": 1, "max": 64}),
+            }
         }
 
     CATEGORY = "StableSwarmUI/video"
@@ -30,7 +117,7 @@ class SwarmSaveAnimationWS:
     FUNCTION = "save_images"
     OUTPUT_NODE = True
 
-    def save_images(self, images, fps, lossless, quality, method, format):
+    def save_images(self, images, fps, lossless, quality, method, format, speed="default", threads=0, segments=1):
         method = self.methods.get(method)
 
         out_img = io.BytesIO()
@@ -39,39 +126,40 @@ class SwarmSaveAnimationWS:
                 type_num = 3
             else:
                 type_num = 4
-            pil_images = []
-            for image in images:
-                i = 255. * image.cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                pil_images.append(img)
-            pil_images[0].save(out_img, save_all=True, duration=int(1000.0 / fps), append_images=pil_images[1 : len(pil_images)], lossless=lossless, quality=quality, method=method, format=format.upper(), loop=0)
+            save_animated_image(out_img, images, fps, format.upper(), "SwarmSaveAnimationWS", lossless=lossless, quality=quality, method=method, loop=0)
         else:
-            i = 255. * images.cpu().numpy()
-            raw_images = np.clip(i, 0, 255).astype(np.uint8)
-            args = [FFMPEG_PATH, "-v", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
-                    "-s", f"{len(raw_images[0][0])}x{len(raw_images[0])}", "-r", str(fps), "-i", "-", "-n" ]
+            start = time.time()
             if format == "h264-mp4":
-                args += ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-crf", "19"]
-                ext = "mp4"
+                codec = "libx264"
+                codec_args = ["-c:v", codec, "-pix_fmt", "yuv420p", "-crf", "19"]
+                # mp4/mov normally need to seek back to write the header, fragmented output lets it stream to a pipe
+                mux_args = ["-movflags", "frag_keyframe+empty_moov", "-f", "mp4"]
                 type_num = 5
             elif format == "webm":
-                args += ["-pix_fmt", "yuv420p", "-crf", "23"]
-                ext = "webm"
+                codec = "libvpx-vp9"
+                codec_args = ["-pix_fmt", "yuv420p", "-crf", "23"]
+                mux_args = ["-f", "webm"]
                 type_num = 6
             elif format == "prores":
-                args += ["-c:v", "prores_ks", "-profile:v", "3", "-pix_fmt", "yuv422p10le"]
-                ext = "mov"
+                codec = "prores_ks"
+                codec_args = ["-c:v", codec, "-profile:v", "3", "-pix_fmt", "yuv422p10le"]
+                mux_args = ["-movflags", "frag_keyframe+empty_moov", "-f", "mov"]
                 type_num = 7
-            path = folder_paths.get_save_image_path("swarm_tmp_", folder_paths.get_temp_directory())[0]
-            rand = '%016x' % random.getrandbits(64)
-            file = os.path.join(path, f"swarm_tmp_{rand}.{ext}")
-            result = subprocess.run(args + [file], input=raw_images.tobytes(), capture_output=True, check=True)
-            if result.stderr:
-                print(result.stderr.decode("utf-8"), file=sys.stderr)
-            # TODO: Is there a way to get ffmpeg to operate entirely in memory?
-            with open(file, "rb") as f:
-                out_img.write(f.read())
-            os.remove(file)
+            codec_args += SPEED_PRESETS[speed].get(codec, [])
+            # Only h264 gets segmented, as MPEG-TS segments can be joined losslessly in memory
+            segments = max(1, min(segments, images.shape[0] // MIN_SEGMENT_FRAMES))
+            if format != "h264-mp4":
+                segments = 1
+            if threads == 0 and segments > 1:
+                threads = max(1, (os.cpu_count() or 1) // segments)
+            if threads > 0:
+                codec_args += ["-threads", str(threads)]
+            if segments > 1:
+                out_img.write(encode_h264_segmented(images, fps, codec_args, segments))
+            else:
+                out_img.write(encode_frames(images, raw_input_args(images, fps) + codec_args + mux_args + ["-"]))
+            elapsed = max(time.time() - start, 0.001)
+            print(f"[SwarmSaveAnimationWS] Encoded {images.shape[0]} frames as {format} ({speed}, {segments} segment(s)) in {elapsed:.2f}s ({images.shape[0] / elapsed:.1f} fps)")
 
         out = io.BytesIO()
         header = struct.pack(">I", type_num)
@@ -86,7 +174,7 @@ class SwarmSaveAnimationWS:
         return { }
 
     @classmethod
-    def IS_CHANGED(s, images, fps, lossless, quality, method, format):
+    def IS_CHANGED(s, images, fps, lossless, quality, method, format, **kwargs):
         return time.time()
 
 
@@ -1,7 +1,6 @@
 import torch, folder_paths, comfy
 from PIL import Image
 import numpy as np
-from ultralytics import YOLO
 
 class SwarmYoloDetection:
     @classmethod
@@ -19,6 +18,8 @@ class SwarmYoloDetection:
     FUNCTION = "seg"
 
     def seg(self, image, model_name, index):
+        # Imported here rather than at load, as ultralytics is slow to import and most runs never use this node
+        from ultralytics import YOLO
         # TODO: Batch support?
         i = 255.0 * image[0].cpu().numpy()
         img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
@@ -1,7 +1,5 @@
-from . import SwarmRemBg, SwarmSaveAnimationWS, SwarmYolo
+from .SwarmCommonImport import import_common_module
 
-NODE_CLASS_MAPPINGS = (
-    SwarmRemBg.NODE_CLASS_MAPPINGS
-    | SwarmSaveAnimationWS.NODE_CLASS_MAPPINGS
-    | SwarmYolo.NODE_CLASS_MAPPINGS
-)
+NODE_MODULES = ["SwarmRemBg", "SwarmSaveAnimationWS", "SwarmYolo"]
+
+NODE_CLASS_MAPPINGS, IMPORT_TIMES = import_common_module("SwarmNodeLoader").load_node_modules(__name__, NODE_MODULES)
@@ -0,0 +1,112 @@
+# Checks SwarmExtractLora's batched do_lora_handle against the per-key full linalg.svd extraction it replaced, on CPU, and times both.
+# SVD factors are only unique up to sign, so results are compared on the reconstructed weight diff (up @ down) rather than on the factors.
+import bench_util
+bench_util.setup_comfy()
+import torch, io, contextlib
+
+extract = bench_util.load_node_module("SwarmExtractLora")
+
+# Largest relative (Frobenius) difference allowed between the old and new reconstructions. The full SVD branch only differs by fp16
+# rounding and the sign-dependent clamp quantile, while svd_lowrank is a randomized approximation, so it gets more room
+FULL_SVD_TOLERANCE = 0.01
+LOWRANK_TOLERANCE = 0.05
+
+def old_extract_lora(diff, rank):
+    conv2d = (len(diff.shape) == 4)
+    kernel_size = None if not conv2d else diff.size()[2:4]
+    conv2d_3x3 = conv2d and kernel_size != (1, 1)
+    out_dim, in_dim = diff.size()[0:2]
+    rank = min(rank, in_dim, out_dim)
+    if conv2d:
+        if conv2d_3x3:
+            diff = diff.flatten(start_dim=1)
+        else:
+            diff = diff.squeeze()
+    U, S, Vh = torch.linalg.svd(diff.float())
+    U = U[:, :rank]
+    S = S[:rank]
+    U = U @ torch.diag(S)
+    Vh = Vh[:rank, :]
+    dist = torch.cat([U.flatten(), Vh.flatten()])
+    hi_val = torch.quantile(dist, extract.CLAMP_QUANTILE)
+    low_val = -hi_val
+    U = U.clamp(low_val, hi_val)
+    Vh = Vh.clamp(low_val, hi_val)
+    if conv2d:
+        U = U.reshape(out_dim, rank, 1, 1)
+        Vh = Vh.reshape(rank, in_dim, kernel_size[0], kernel_size[1])
+    return (U, Vh)
+
+def old_handle(base_data, other_data, rank, prefix, require, do_bias):
+    out_data = {}
+    for key in base_data.keys():
+        diff = other_data[key] - base_data[key]
+        key = key[len(require):]
+        if float(diff.abs().max()) < 1e-5:
+            continue
+        if key.endswith(".weight") and len(diff.shape) >= 2:
+            name = f"lora_{prefix}_{key[:-len('.weight')].replace('.', '_')}"
+            up, down = old_extract_lora(diff, rank)
+            out_data[f"{name}.lora_up.weight"] = up.contiguous().half().cpu()
+            out_data[f"{name}.lora_down.weight"] = down.contiguous().half().cpu()
+        elif key.endswith(".bias") and do_bias:
+            out_data[f"lora_{prefix}_{key[:-len('.bias')].replace('.', '_')}.diff_b"] = diff.contiguous().half().cpu()
+    return out_data
+
+def finetune_diff(shape, generator):
+    """A weight diff like a finetune leaves behind: mostly low-rank, plus a little full-rank noise, so truncating it to a rank is meaningful."""
+    out_dim, in_flat = shape[0], int(torch.tensor(shape[1:]).prod())
+    low = torch.randn(out_dim, 8, generator=generator) @ torch.randn(8, in_flat, generator=generator) * 0.01
+    return (low + torch.randn(out_dim, in_flat, generator=generator) * 0.001).reshape(shape)
+
+# name -> weight shape: linears, 1x1 and 3x3 convs at SD-like sizes, including several same-shape keys so they get batched together
+LAYERS = {f"linear_{i}": (320, 320) for i in range(4)} | {f"proj_{i}": (1280, 320) for i in range(2)} | {"small": (64, 48)} \
+    | {f"conv1x1_{i}": (640, 320, 1, 1) for i in range(3)} | {f"conv3x3_{i}": (320, 320, 3, 3) for i in range(3)} | {"conv3x3_out": (4, 320, 3, 3)}
+
+def make_state_dicts(seed):
+    generator = torch.Generator().manual_seed(seed)
+    base, other = {}, {}
+    for name, shape in LAYERS.items():
+        for kind, kind_shape in [("weight", shape), ("bias", shape[:1])]:
+            key = f"diffusion_model.{name}.{kind}"
+            base[key] = torch.randn(kind_shape, generator=generator) * 0.1
+            other[key] = base[key] + finetune_diff(kind_shape, generator) if kind == "weight" else base[key] + torch.randn(kind_shape, generator=generator) * 0.01
+    # Unaltered and 1D keys, which both versions have to leave out
+    base["diffusion_model.unchanged.weight"] = other["diffusion_model.unchanged.weight"] = torch.randn(320, 320, generator=generator)
+    base["diffusion_model.norm.weight"] = torch.ones(320)
+    other["diffusion_model.norm.weight"] = torch.ones(320) * 1.1
+    return base, other
+
+def reconstruct(out_data, name):
+    up, down = out_data[f"{name}.lora_up.weight"].float(), out_data[f"{name}.lora_down.weight"].float()
+    return up.flatten(start_dim=1) @ down.flatten(start_dim=1)
+
+def quiet(func):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func()
+
+base, other = make_state_dicts(0)
+torch.manual_seed(0)
+for rank in [4, 16, 64, 256]:
+    print(f"rank {rank}:")
+    old = quiet(lambda: old_handle(base, other, rank, "unet", "diffusion_model.", True))
+    new = quiet(lambda: extract.do_lora_handle(base, other, rank, "unet", "diffusion_model.", True, lambda: None, device="cpu"))
+    bench_util.check("same keys", set(old.keys()) == set(new.keys()), f"({len(new)} tensors)")
+    bench_util.check("same shapes and dtypes", all(old[k].shape == new[k].shape and new[k].dtype == torch.float16 for k in old.keys() if k in new))
+    bench_util.check("biases match", all(torch.equal(old[k], new[k]) for k in old.keys() if k.endswith(".diff_b") and k in new))
+    worst = {}
+    for name, shape in LAYERS.items():
+        flat = (shape[0], int(torch.tensor(shape[1:]).prod()))
+        lowrank = min(rank, shape[0], shape[1]) <= min(flat) * extract.LOWRANK_FRACTION
+        expected = reconstruct(old, f"lora_unet_{name}")
+        error = ((reconstruct(new, f"lora_unet_{name}") - expected).norm() / expected.norm()).item()
+        branch = "svd_lowrank" if lowrank else "linalg.svd"
+        worst[branch] = max(worst.get(branch, 0), error)
+    for branch, error in worst.items():
+        tolerance = LOWRANK_TOLERANCE if branch == "svd_lowrank" else FULL_SVD_TOLERANCE
+        bench_util.check(f"{branch} reconstructions within {tolerance}", error <= tolerance, f"(worst relative difference {error:.4f})")
+    old_ms = bench_util.bench(lambda: quiet(lambda: old_handle(base, other, rank, "unet", "diffusion_model.", True)), repeat=2)
+    new_ms = bench_util.bench(lambda: quiet(lambda: extract.do_lora_handle(base, other, rank, "unet", "diffusion_model.", True, lambda: None, device="cpu")), repeat=2)
+    print(f"    per-key linalg.svd {old_ms:9.2f}ms, batched {new_ms:9.2f}ms ({old_ms / new_ms:.1f}x)")
+
+bench_util.finish()
@@ -0,0 +1,54 @@
+# Quality versus speed of SwarmImageScaleForMP's resize modes, against the common_upscale bilinear call it used to make.
+# Quality is PSNR against Pillow's float Lanczos resize, on a zone plate (fine concentric rings, the worst case for aliasing).
+import bench_util
+bench_util.setup_comfy()
+import torch, math
+import numpy as np
+import comfy.utils
+from PIL import Image
+
+images = bench_util.load_node_module("SwarmImages")
+
+MODES = ["bilinear", "area", "lanczos", "antialiased_bilinear"]
+# (batch, height, width) -> (height, width), covering megapixel-target downscales, a batch, and an upscale
+CASES = [((1, 1024, 1024), (512, 512)), ((1, 2048, 2048), (1024, 1024)), ((1, 1536, 2048), (768, 1024)), ((16, 768, 768), (512, 512)), ((1, 512, 512), (1024, 1024))]
+
+def zone_plate(batch, height, width):
+    y = torch.linspace(-1, 1, height)[:, None]
+    x = torch.linspace(-1, 1, width)[None, :]
+    rings = 0.5 + 0.5 * torch.cos(math.pi * max(height, width) * 0.5 * (x * x + y * y))
+    return torch.stack([rings, rings.flip(0), rings.flip(1)], dim=-1)[None].repeat(batch, 1, 1, 1).contiguous()
+
+def old_scale(image, width, height):
+    return comfy.utils.common_upscale(image.movedim(-1, 1), width, height, "bilinear", "disabled").movedim(1, -1)
+
+def reference(image, width, height):
+    channels = [np.asarray(Image.fromarray(image[0, :, :, c].numpy(), mode="F").resize((width, height), Image.LANCZOS)) for c in range(image.shape[-1])]
+    return torch.from_numpy(np.stack(channels, axis=-1)).clamp(0, 1)
+
+def psnr(a, b):
+    mse = (a - b).pow(2).mean().item()
+    return 10 * math.log10(1 / max(mse, 1e-12))
+
+for (batch, old_height, old_width), (height, width) in CASES:
+    image = zone_plate(batch, old_height, old_width)
+    expected = reference(image, width, height)
+    print(f"{batch}x{old_width}x{old_height} -> {width}x{height}:")
+    old = old_scale(image, width, height)
+    old_ms = bench_util.bench(lambda: old_scale(image, width, height), repeat=3)
+    print(f"    {'common_upscale':22} {old_ms:9.2f}ms  PSNR {psnr(old[0], expected):6.2f}dB")
+    for mode in MODES:
+        result = images.resize_images(image, width, height, mode)
+        if mode == "bilinear":
+            bench_util.check("bilinear matches common_upscale", torch.equal(result, old))
+        ms = bench_util.bench(lambda: images.resize_images(image, width, height, mode), repeat=3)
+        print(f"    {mode:22} {ms:9.2f}ms  PSNR {psnr(result[0], expected):6.2f}dB")
+
+# Chunked processing has to give the same result as one pass over the batch
+image = zone_plate(8, 512, 512)
+full = {mode: images.resize_images(image, 256, 256, mode) for mode in MODES}
+images.RESIZE_BUDGET = 1
+for mode in MODES:
+    bench_util.check(f"chunked {mode} matches unchunked", torch.allclose(images.resize_images(image, 256, 256, mode), full[mode], atol=1e-6))
+
+bench_util.finish()
@@ -0,0 +1,61 @@
+# Checks SwarmReferenceOnly's vectorized attn1 patch against the per-sample loop it replaced (which only supported one reference),
+# and estimates its share of a sampling step with a CPU attention stand-in over SD1.5's self-attention layers.
+import bench_util
+import torch
+from torch.nn import functional as F
+
+reference = bench_util.load_node_module("SwarmReference")
+
+class PatchCapture:
+    """Takes the place of a ModelPatcher, just keeping the attn1 patch the node installs."""
+    def clone(self):
+        return self
+
+    def set_model_attn1_patch(self, patch):
+        self.patch = patch
+
+def new_patch(latent_batch, ref_count):
+    model = PatchCapture()
+    reference.SwarmReferenceOnly().reference_only(model, {"samples": torch.zeros(ref_count, 4, 8, 8)}, {"samples": torch.zeros(latent_batch, 4, 8, 8)})
+    return model.patch
+
+def old_patch(batch):
+    def reference_apply(q, k, v, extra_options):
+        k = k.clone().repeat(1, 2, 1)
+        for o in range(0, q.shape[0], batch):
+            for x in range(1, batch):
+                k[x + o, q.shape[1]:] = q[o,:]
+        return q, k, k
+    return reference_apply
+
+def attention(q, k, v, heads=8):
+    """Plain multi-head attention, a chunk of queries at a time to keep CPU memory sane at 64x64 latents."""
+    b, _, dim = q.shape
+    q, k, v = (x.view(b, -1, heads, dim // heads).transpose(1, 2) for x in (q, k, v))
+    out = torch.cat([F.scaled_dot_product_attention(q[:, :, i:i + 512], k, v) for i in range(0, q.shape[2], 512)], dim=2)
+    return out.transpose(1, 2).reshape(b, -1, dim)
+
+# SD1.5 self-attention layers at 512px: (tokens, channels, how many attn1 blocks run at that size)
+LAYERS = [(4096, 320, 5), (1024, 640, 5), (256, 1280, 5), (64, 1280, 1)]
+
+torch.manual_seed(0)
+for latent_batch in [1, 4]:
+    batch = latent_batch + 1
+    # Cond and uncond groups, each [reference, latents...]
+    rows = batch * 2
+    print(f"latent batch {latent_batch}, 1 reference:")
+    patch = new_patch(latent_batch, 1)
+    old = old_patch(batch)
+    step_old, step_new, step_none = 0, 0, 0
+    for tokens, dim, count in LAYERS:
+        q, k = torch.randn(rows, tokens, dim), torch.randn(rows, tokens, dim)
+        bench_util.check(f"keys {tokens}x{dim}", torch.equal(old(q, k, k, {})[1], patch(q, k, k, {})[1]))
+        step_old += count * bench_util.bench(lambda: attention(*old(q, k, k, {})), repeat=2)
+        step_new += count * bench_util.bench(lambda: attention(*patch(q, k, k, {})), repeat=2)
+        step_none += count * bench_util.bench(lambda: attention(q, k, k), repeat=2)
+        patch_old = bench_util.bench(lambda: old(q, k, k, {}))
+        patch_new = bench_util.bench(lambda: patch(q, k, k, {}))
+        print(f"    {tokens}x{dim}: key extension loop {patch_old:8.2f}ms, vectorized {patch_new:8.2f}ms")
+    print(f"    attn1 time per step: no reference {step_none:.0f}ms, loop {step_old:.0f}ms, vectorized {step_new:.0f}ms")
+
+bench_util.finish()
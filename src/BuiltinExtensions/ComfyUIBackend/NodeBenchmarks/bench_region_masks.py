@@ -0,0 +1,49 @@
+# Compares SwarmNormalizeRegionMasks against the node chain WorkflowGenerator builds for regional prompts:
+# SwarmOverMergeMasksForOverlapFix over all regions, SwarmExcludeFromMask for the background, and SwarmCleanOverlapMasksExceptSelf per region.
+import bench_util
+bench_util.setup_comfy()
+import torch
+
+masks = bench_util.load_node_module("SwarmMasks")
+
+def old_chain(regions):
+    merged = regions[0]
+    for region in regions[1:]:
+        merged = masks.SwarmOverMergeMasksForOverlapFix().mask_overmerge(merged, region)[0]
+    full = masks.SwarmSquareMaskFromPercent().mask_from_perc(0, 0, 1, 1, 1)[0]
+    background = masks.SwarmExcludeFromMask().mask_exclude(full, merged)[0]
+    cleaned = [masks.SwarmCleanOverlapMasksExceptSelf().mask_clean(region, merged)[0] for region in regions]
+    return cleaned, background
+
+def fused(regions):
+    out = masks.SwarmNormalizeRegionMasks().normalize(**{f"mask_{i + 1}": region for i, region in enumerate(regions)})
+    return [m for m in out[:-1] if m is not None], out[-1]
+
+def rect_regions(count):
+    generator = torch.Generator().manual_seed(count)
+    regions = []
+    for _ in range(count):
+        x, y, w, h = (torch.rand(4, generator=generator) * 0.6).tolist()
+        strength = [0.25, 0.5, 0.75, 1.0][int(torch.randint(0, 4, (1,), generator=generator))]
+        regions.append(masks.SwarmSquareMaskFromPercent().mask_from_perc(x, y, w + 0.2, h + 0.2, strength)[0])
+    return regions
+
+def raster_regions(count, size):
+    generator = torch.Generator().manual_seed(count)
+    return [torch.rand((1, size, size), generator=generator) for _ in range(count)]
+
+for label, make in [("rectangles 256x256", rect_regions), ("raster 1024x1024", lambda count: raster_regions(count, 1024))]:
+    print(f"{label}:")
+    for count in [2, 4, 8, 16]:
+        regions = make(count)
+        old_cleaned, old_background = old_chain(regions)
+        new_cleaned, new_background = fused(regions)
+        diff = max((a - b).abs().max().item() for a, b in zip(old_cleaned + [old_background], new_cleaned + [new_background]))
+        shapes_match = all(a.shape == b.shape for a, b in zip(old_cleaned + [old_background], new_cleaned + [new_background]))
+        # The fused node sums all masks at once rather than pairwise, so raster masks can differ by float rounding
+        bench_util.check(f"{count} regions match", shapes_match and diff <= 1e-5, f"(max diff {diff:.2e})")
+        old_ms = bench_util.bench(lambda: old_chain(regions))
+        new_ms = bench_util.bench(lambda: fused(regions))
+        print(f"    chain {old_ms:8.2f}ms, fused {new_ms:8.2f}ms ({old_ms / new_ms:.1f}x)")
+
+bench_util.finish()
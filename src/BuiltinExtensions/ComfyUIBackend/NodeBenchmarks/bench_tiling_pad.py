@@ -0,0 +1,39 @@
+# Checks SwarmTiling's single-allocation pad_assym against the two-F.pad chain it replaced, and times both on typical UNet and VAE conv inputs.
+import bench_util
+import torch
+from torch.nn import functional as F
+
+tiling = bench_util.load_node_module("SwarmTiling")
+
+def old_pad(input, left, right, top, bottom, mode):
+    if mode == "x_circular":
+        padded = F.pad(input, (left, right, 0, 0), "circular")
+        return F.pad(padded, (0, 0, top, bottom), "constant", 0)
+    padded = F.pad(input, (left, right, 0, 0), "constant", 0)
+    return F.pad(padded, (0, 0, top, bottom), "circular")
+
+# (batch, channels, height, width) of conv inputs in an SD1/SDXL UNet at 512-1024px, and a VAE decoder block
+SHAPES = [(2, 320, 64, 64), (2, 640, 32, 32), (2, 1280, 16, 16), (2, 320, 128, 128), (1, 128, 512, 512)]
+# (left, right, top, bottom), including one-sided and zero padding along either axis
+PADDINGS = [(1, 1, 1, 1), (0, 0, 1, 1), (1, 1, 0, 0), (0, 1, 0, 1), (2, 2, 2, 2)]
+
+torch.manual_seed(0)
+for mode in ["x_circular", "y_circular"]:
+    print(f"{mode}:")
+    for shape in SHAPES:
+        input = torch.randn(shape)
+        for padding in PADDINGS:
+            bench_util.check(f"pad {shape} {padding}", torch.equal(old_pad(input, *padding, mode), tiling.pad_assym(input, *padding, mode)))
+        old_ms = bench_util.bench(lambda: old_pad(input, 1, 1, 1, 1, mode))
+        new_ms = bench_util.bench(lambda: tiling.pad_assym(input, 1, 1, 1, 1, mode))
+        print(f"    {shape}: two F.pad {old_ms:8.2f}ms, pad_assym {new_ms:8.2f}ms ({old_ms / new_ms:.1f}x)")
+    # Full conv forward through a patched layer, as the model runs it
+    conv = torch.nn.Conv2d(320, 320, 3, padding=1)
+    input = torch.randn(2, 320, 64, 64)
+    with torch.no_grad():
+        tiling.make_circular_assym(conv, mode)
+        result = conv(input)
+        expected = F.conv2d(old_pad(input, 1, 1, 1, 1, mode), conv.weight, conv.bias)
+    bench_util.check("conv forward", torch.equal(result, expected))
+
+bench_util.finish()
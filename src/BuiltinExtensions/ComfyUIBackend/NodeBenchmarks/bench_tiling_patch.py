@@ -0,0 +1,109 @@
+# Compares the cost of making a tiled model/VAE: the deepcopy SwarmModelTiling and SwarmTileableVAE used to make, against the
+# clone + object patches and copy + proxy they use now. Measures patch time and how much RSS each tiled variant adds, on a synthetic conv stack.
+import bench_util
+bench_util.setup_comfy()
+import torch, copy, gc, psutil
+import comfy.model_patcher
+
+tiling = bench_util.load_node_module("SwarmTiling")
+
+class SyntheticUnet(torch.nn.Module):
+    """Stands in for a BaseModel, with convs at SD-like channel counts under diffusion_model."""
+    def __init__(self, channels, depth):
+        super().__init__()
+        layers = [torch.nn.Conv2d(4, channels, 3, padding=1)]
+        for _ in range(depth):
+            layers += [torch.nn.SiLU(), torch.nn.Conv2d(channels, channels, 3, padding=1)]
+        layers += [torch.nn.SiLU(), torch.nn.Conv2d(channels, 4, 3, padding=1)]
+        self.diffusion_model = torch.nn.Sequential(*layers)
+
+    def forward(self, x):
+        return self.diffusion_model(x)
+
+class SyntheticFirstStage(torch.nn.Module):
+    def __init__(self, channels, depth):
+        super().__init__()
+        self.decoder = SyntheticUnet(channels, depth).diffusion_model
+
+    def decode(self, x):
+        return self.decoder(x)
+
+class SyntheticVAE:
+    def __init__(self, channels, depth):
+        self.first_stage_model = SyntheticFirstStage(channels, depth)
+
+def rss_mb():
+    gc.collect()
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def old_model_tiling(model, mode):
+    m = copy.deepcopy(model)
+    m.model.apply(tiling.make_circular if mode == "circular" else lambda x: tiling.make_circular_assym(x, mode))
+    return m
+
+def old_vae_tiling(vae, mode):
+    v = copy.deepcopy(vae)
+    v.first_stage_model.apply(tiling.make_circular if mode == "circular" else lambda x: tiling.make_circular_assym(x, mode))
+    return v
+
+def apply_object_patches(patcher):
+    """Sets a ModelPatcher's object patches the way it does when loading the model, returning the values to restore."""
+    backup = {}
+    for key, value in patcher.object_patches.items():
+        *path, name = key.split(".")
+        obj = patcher.model
+        for part in path:
+            obj = getattr(obj, part)
+        backup[key] = (obj, name, obj.__dict__.get(name, None), name in obj.__dict__)
+        setattr(obj, name, value)
+    return backup
+
+def restore_object_patches(backup):
+    for obj, name, value, had_own in backup.values():
+        if had_own:
+            setattr(obj, name, value)
+        else:
+            delattr(obj, name)
+
+def measure(name, make, count=4):
+    """Times making one tiled variant, and how much RSS keeping a few of them alive adds on top of the source."""
+    ms = bench_util.bench(make, repeat=3)
+    before = rss_mb()
+    variants = [make() for _ in range(count)]
+    per_variant = (rss_mb() - before) / count
+    del variants
+    print(f"    {name:26} {ms:9.2f}ms  +{per_variant:8.1f}MB per variant")
+
+# (channels, depth), roughly the weight size of a small and a mid-sized UNet block stack
+SIZES = [(320, 16), (640, 24)]
+
+torch.manual_seed(0)
+with torch.no_grad():
+    for channels, depth in SIZES:
+        unet = SyntheticUnet(channels, depth)
+        model = comfy.model_patcher.ModelPatcher(unet, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+        vae = SyntheticVAE(channels, depth)
+        weights_mb = sum(p.nbytes for p in unet.parameters()) / (1024 * 1024)
+        print(f"{depth + 2} convs at {channels} channels ({weights_mb:.0f}MB of weights):")
+        x = torch.randn(1, 4, 32, 32)
+        plain = unet(x)
+        for mode in ["circular", "x_circular", "y_circular"]:
+            old = old_model_tiling(model, mode)
+            expected = old.model(x)
+            new = tiling.SwarmModelTiling().adapt(model, {"circular": "Both", "x_circular": "X", "y_circular": "Y"}[mode])[0]
+            bench_util.check(f"{mode} source untouched before load", torch.equal(unet(x), plain))
+            backup = apply_object_patches(new)
+            bench_util.check(f"{mode} object-patched model matches deepcopy", torch.equal(new.model(x), expected))
+            restore_object_patches(backup)
+            bench_util.check(f"{mode} source restored after unload", torch.equal(unet(x), plain))
+            old_vae = old_vae_tiling(vae, mode)
+            new_vae = tiling.SwarmTileableVAE().adapt(vae, {"circular": "Both", "x_circular": "X", "y_circular": "Y"}[mode])[0]
+            bench_util.check(f"{mode} proxied VAE matches deepcopy", torch.equal(new_vae.first_stage_model.decode(x), old_vae.first_stage_model.decode(x)))
+            del old, new, old_vae, new_vae
+        measure("model deepcopy", lambda: old_model_tiling(model, "x_circular"))
+        measure("model clone + patches", lambda: tiling.SwarmModelTiling().adapt(model, "X")[0])
+        measure("vae deepcopy", lambda: old_vae_tiling(vae, "x_circular"))
+        # The VAE variant is cached per source and mode, so clear that to time building it
+        measure("vae copy + proxy", lambda: (tiling.TILED_VAES.clear(), tiling.SwarmTileableVAE().adapt(vae, "X")[0])[1])
+
+bench_util.finish()
@@ -0,0 +1,43 @@
+import os, sys, time, importlib.util
+
+# Shared setup for the standalone node benchmarks. These run against the real ComfyUI install (on CPU), loading single Swarm node modules by path
+# rather than through the node packages, so no server is needed.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+EXTRA_NODES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ExtraNodes")
+
+def setup_comfy():
+    """Puts ComfyUI (COMFYUI_PATH, default the installer's location) on the path and forces CPU mode before any of its device setup runs."""
+    sys.path.insert(0, os.environ.get("COMFYUI_PATH", os.path.join(REPO_ROOT, "dlbackend", "comfy", "ComfyUI")))
+    import comfy.cli_args
+    comfy.cli_args.args.cpu = True
+    import comfy.model_management, comfy.utils
+
+def load_node_module(name, package="SwarmComfyCommon"):
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", os.path.join(EXTRA_NODES, package, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def bench(func, repeat=5):
+    """Returns the best wall time in milliseconds over a few runs, after one warm-up run."""
+    func()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+FAILURES = 0
+
+def check(name, ok, detail=""):
+    global FAILURES
+    print(f"  {'OK  ' if ok else 'FAIL'} {name} {detail}")
+    if not ok:
+        FAILURES += 1
+
+def finish():
+    if FAILURES:
+        print(f"{FAILURES} check(s) failed")
+        sys.exit(1)
+    print("All checks passed")
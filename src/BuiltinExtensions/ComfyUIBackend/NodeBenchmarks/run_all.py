@@ -0,0 +1,20 @@
+# Runs every bench_*.py script here with the current Python, printing each one's full output and then a pass/fail summary with wall times.
+# Exits with 1 if any script failed, so the whole output can be pasted as the record of a benchmark run.
+import os, sys, glob, subprocess, time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+results = []
+for script in sorted(glob.glob(os.path.join(BENCH_DIR, "bench_*.py"))):
+    name = os.path.basename(script)
+    if name == "bench_util.py":
+        continue
+    print(f"==== {name}", flush=True)
+    start = time.perf_counter()
+    code = subprocess.call([sys.executable, script], cwd=BENCH_DIR)
+    results.append((name, code, time.perf_counter() - start))
+
+print("==== Summary")
+for name, code, elapsed in results:
+    print(f"  {'OK  ' if code == 0 else 'FAIL'} {name} ({elapsed:.1f}s)")
+sys.exit(1 if any(code != 0 for _, code, _ in results) else 0)
@@ -1163,7 +1163,8 @@ public class WorkflowGeneratorSteps
                 {
                     string bounced = g.CreateNode("SwarmVideoBoomerang", new JObject()
                     {
-                        ["images"] = g.FinalImageOut
+                        ["images"] = g.FinalImageOut,
+                        ["lazy"] = true
                     });
                     g.FinalImageOut = [bounced, 0];
                 }